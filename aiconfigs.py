@@ -1,38 +1,202 @@
+import asyncio
 import os
 import json
 import re
 import datetime
-import ldclient
-from ldclient import Context
-from ldclient.config import Config
-from ldai.client import LDAIClient, AIConfig, ModelConfig, ProviderConfig, LDMessage
-from ldai.tracker import TokenUsage
-from langchain.chat_models import init_chat_model
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+import threading
+import time
 from dotenv import load_dotenv
+from model_router import ModelRouter
+import metrics
+
+# ldclient, ldai and LangChain are imported on first AI use; importing them costs most of app startup
 
 sdk_key = os.getenv('LAUNCHDARKLY_SDK_KEY')
 
+# Offline mode skips the LaunchDarkly connection and always serves default_value
+offline = os.getenv('LAUNCHDARKLY_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
 # Set config_key to the AI Config key you want to evaluate.
 # the key on the RHS of the dashboard is the key of the AI Config key 
 ai_config_key = os.getenv('LAUNCHDARKLY_AI_CONFIG_KEY', 'diary-ai')
 
+# A second AI Config whose model is raced against the first when that one runs past its p95; empty disables hedging
+hedge_config_key = os.getenv('LAUNCHDARKLY_HEDGE_AI_CONFIG_KEY', '')
+
+# Rolling per-model latency and error stats, used to pick the first model and the hedge deadline
+router = ModelRouter(
+    min_samples=int(os.getenv('AI_HEDGE_MIN_SAMPLES', '20')),
+    default_deadline=float(os.getenv('AI_HEDGE_DEFAULT_DEADLINE', '2.0')),
+    min_deadline=float(os.getenv('AI_HEDGE_MIN_DEADLINE', '0.25')),
+)
+
+# Stream completions and stop generating as soon as a coordinate pair has arrived
+stream_responses = os.getenv('AI_STREAM_RESPONSES', 'true').lower() in ('1', 'true', 'yes')
+
+DEFAULT_SYSTEM_MESSAGE = "You are a helpful assistant that can answer questions and help with tasks."
+
+# User context and default AI configuration, built by init_ld_client since they need the SDK
+context = None
+default_value = None
+
+def _build_defaults():
+    global context, default_value
+    from ldclient import Context
+    from ldai.client import AIConfig, ModelConfig, ProviderConfig, LDMessage
+
+    # User context, built once since it never changes between requests
+    context = (
+        Context
+        .builder('example-user-key')
+        .kind('user')
+        .name('Sandy')
+        .build()
+    )
+
+    # Default AI configuration
+    default_value = AIConfig(
+        enabled=True,
+        model=ModelConfig(name='gpt-4o', parameters={}),
+        provider=ProviderConfig(name='openai'),
+
+        messages=[LDMessage(role='system', content=DEFAULT_SYSTEM_MESSAGE)],
+    )
+
+    # # Optionally, you can use a disabled AIConfig
+    # default_value = AIConfig(
+    #     enabled=False
+    # )
+
+def init_chat_model(**kwargs):
+    """langchain.chat_models.init_chat_model, imported on first use"""
+    from langchain.chat_models import init_chat_model
+    return init_chat_model(**kwargs)
+
+def preload():
+    """Import the LaunchDarkly and LangChain modules now, e.g. in a pre-fork master, instead of on the first submission"""
+    import ldclient.config
+    import ldai.client
+    import ldai.tracker
+    import langchain.chat_models
+    import langchain_core.messages
+
+# Process-wide LaunchDarkly AI client, created once by init_ld_client
+_ai_client = None
+_ai_client_lock = threading.Lock()
+
+# Initialized chat models keyed by (config key, provider, model name, parameters), for each config's current variation only
+_chat_models = {}
+_chat_models_variations = {}  # config key -> variation the cached models were built for
+_chat_models_lock = threading.Lock()
+
+# A complete "{lat, lon}" pair; the closing bracket guarantees the longitude is fully streamed
+COORDINATE_PATTERN = re.compile(r"\{\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*\}")
+
+def find_coordinates(text):
+    """Return the first in-range {lat, lon} pair in text, or None"""
+    for match in COORDINATE_PATTERN.finditer(text):
+        latitude, longitude = float(match.group(1)), float(match.group(2))
+        if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            return {"latitude": latitude, "longitude": longitude}
+    return None
+
 def parse_coordinates(ai_response):
-    """Parse coordinates from the AI response string"""
-    # Find content between brackets
-    start_bracket = ai_response.find("{")
-    end_bracket = ai_response.find("}")
-    if start_bracket != -1 and end_bracket != -1:
-        # Extract and split the coordinates
-        coords_str = ai_response[start_bracket + 1:end_bracket]
-        lat_str, lon_str = coords_str.split(",")
-        # Convert to float and clean up any whitespace
-        latitude = float(lat_str.strip())
-        longitude = float(lon_str.strip())
-        coordinates = {"latitude": latitude, "longitude": longitude}
-    else:
-        coordinates = None
-    return coordinates
+    """Parse coordinates from the AI response string, returning None when there is no valid pair"""
+    return find_coordinates(ai_response or "")
+
+# Structured output schema for get_ai_coordinates
+COORDINATES_SCHEMA = {
+    "title": "coordinates",
+    "description": "Latitude and longitude of the restaurant in decimal degrees",
+    "type": "object",
+    "properties": {
+        "latitude": {"type": "number", "minimum": -90, "maximum": 90},
+        "longitude": {"type": "number", "minimum": -180, "maximum": 180}
+    },
+    "required": ["latitude", "longitude"]
+}
+
+def stream_until_coordinates(llm, messages, cancel=None):
+    """Stream a completion, cancelling it once a coordinate pair is found or the cancel event is set;
+    returns the merged message chunk"""
+    completion = None
+    text = ""
+    stream = llm.stream(messages)
+    try:
+        for chunk in stream:
+            completion = chunk if completion is None else completion + chunk
+            chunk_text = chunk.text()
+            text += chunk_text
+            if "}" in chunk_text and find_coordinates(text):
+                break
+            if cancel is not None and cancel.is_set():
+                break
+    finally:
+        # Closing the generator closes the provider's HTTP stream, so the rest is never generated
+        stream.close()
+
+    return _finish_stream(llm, messages, completion, text)
+
+async def astream_until_coordinates(llm, messages):
+    """stream_until_coordinates over llm.astream"""
+    completion = None
+    text = ""
+    stream = llm.astream(messages)
+    try:
+        async for chunk in stream:
+            completion = chunk if completion is None else completion + chunk
+            chunk_text = chunk.text()
+            text += chunk_text
+            if "}" in chunk_text and find_coordinates(text):
+                break
+    finally:
+        await stream.aclose()
+    return _finish_stream(llm, messages, completion, text)
+
+def stream_structured(structured_llm, llm, messages, cancel=None):
+    """Stream a with_structured_output(include_raw=True) call, stopping early if the cancel event is set;
+    returns {"raw": merged message chunk, "parsed": ...}, parsed being None for a cancelled call"""
+    # The structured runnable is RunnableMap(raw=model) | parser; its parser step is wrapped in
+    # fallbacks, which buffer the whole stream, so stream the model step and parse once it ends
+    raw = None
+    cancelled = False
+    stream = structured_llm.first.stream(messages)
+    try:
+        for chunk in stream:
+            raw = chunk["raw"] if raw is None else raw + chunk["raw"]
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+    finally:
+        stream.close()
+
+    if raw is None or cancelled:
+        text = ""
+        if raw is not None:
+            # Structured output arrives as tool call arguments rather than text
+            text = raw.text() + "".join(c.get("args") or "" for c in raw.tool_call_chunks)
+        return {"raw": _finish_stream(llm, messages, raw, text), "parsed": None}
+    return structured_llm.last.invoke({"raw": raw})
+
+def _finish_stream(llm, messages, completion, text):
+    if completion is None:
+        from langchain_core.messages import AIMessage
+        completion = AIMessage(content="")
+    if not completion.usage_metadata:
+        # Providers report usage in the final chunk, which a cancelled stream never receives,
+        # so count the prompt and the text received with the model's tokenizer instead
+        try:
+            input_tokens = llm.get_num_tokens_from_messages(messages)
+            output_tokens = llm.get_num_tokens(text) if text else 0
+        except Exception as e:
+            print(f"Could not estimate token usage for a cancelled stream: {e}")
+        else:
+            completion.usage_metadata = {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens
+            }
+    return completion
 
 def map_provider_to_langchain(provider_name):
     """Map LaunchDarkly provider names to LangChain provider names."""
@@ -64,115 +228,254 @@ def track_langchain_metrics(tracker, func):
     :return: Result of the tracked function.
     """
     try:
-        result = tracker.track_duration_of(func)
+        with metrics.span("llm.call"):
+            result = tracker.track_duration_of(func)
         tracker.track_success()
-        if hasattr(result, "usage_metadata") and result.usage_metadata:
-            # Extract token usage from LangChain response
-            usage_data = result.usage_metadata
-            token_usage = TokenUsage(
-                input=usage_data.get("input_tokens", 0),
-                output=usage_data.get("output_tokens", 0),
-                total=usage_data.get("total_tokens", 0) # LangChain also has values for input_token_details { cache_creation, cache_read }
-            )
-            tracker.track_tokens(token_usage)
+        _track_token_usage(tracker, result)
     except Exception:
         tracker.track_error()
         raise
 
     return result
 
+async def track_langchain_metrics_async(tracker, func):
+    """track_langchain_metrics for a coroutine function, e.g. one that awaits llm.ainvoke"""
+    start_time = time.time()
+    try:
+        with metrics.span("llm.call"):
+            result = await func()
+    except Exception:
+        tracker.track_duration(int((time.time() - start_time) * 1000))
+        tracker.track_error()
+        raise
+    tracker.track_duration(int((time.time() - start_time) * 1000))
+    tracker.track_success()
+    _track_token_usage(tracker, result)
+    return result
+
+def _track_token_usage(tracker, result):
+    if hasattr(result, "usage_metadata") and result.usage_metadata:
+        from ldai.tracker import TokenUsage
+        # Extract token usage from LangChain response
+        usage_data = result.usage_metadata
+        token_usage = TokenUsage(
+            input=usage_data.get("input_tokens", 0),
+            output=usage_data.get("output_tokens", 0),
+            total=usage_data.get("total_tokens", 0) # LangChain also has values for input_token_details { cache_creation, cache_read }
+        )
+        tracker.track_tokens(token_usage)
+        metrics.llm_tokens.inc("input", amount=token_usage.input)
+        metrics.llm_tokens.inc("output", amount=token_usage.output)
+
 # Initialize LaunchDarkly client
 def init_ld_client():
-    if not sdk_key:
-        raise ValueError("*** Please set the LAUNCHDARKLY_SDK_KEY env first")
-    if not ai_config_key:
-        raise ValueError("*** Please set the LAUNCHDARKLY_AI_CONFIG_KEY env first")
-
-    ldclient.set_config(Config(sdk_key))
-    if not ldclient.get().is_initialized():
-        raise ValueError("*** SDK failed to initialize. Please check your internet connection and SDK credential.")
-    
-    aiclient = LDAIClient(ldclient.get())
-    print("*** SDK successfully initialized")
-    return aiclient
+    """Return the shared AI client, initializing the LaunchDarkly SDK on first use"""
+    global _ai_client
+    if _ai_client is not None:
+        return _ai_client
 
-def get_ai_response(user_input, user_id="example-user", user_name="Anonymous"):
-    aiclient = init_ld_client()
-    """Handle AI interaction with LaunchDarkly configuration"""
-    DEFAULT_SYSTEM_MESSAGE = "You are a helpful assistant that can answer questions and help with tasks."
-    
-    # Create user context
-    context = (
-        Context
-        .builder('example-user-key')
-        .kind('user')
-        .name('Sandy')
-        .build()
-    )
+    with _ai_client_lock:
+        if _ai_client is not None:
+            return _ai_client
 
-    # Default AI configuration
-    default_value = AIConfig(
-        enabled=True,
-        model=ModelConfig(name='gpt-4o', parameters={}),
-        provider=ProviderConfig(name='openai'),
+        if not sdk_key and not offline:
+            raise ValueError("*** Please set the LAUNCHDARKLY_SDK_KEY env first")
+        if not ai_config_key:
+            raise ValueError("*** Please set the LAUNCHDARKLY_AI_CONFIG_KEY env first")
 
-        messages=[LDMessage(role='system', content=DEFAULT_SYSTEM_MESSAGE)],
+        import ldclient
+        from ldclient.config import Config
+        from ldai.client import LDAIClient
+        with metrics.span("launchdarkly.init"):
+            ldclient.set_config(Config(sdk_key or "offline", offline=offline))
+        if not ldclient.get().is_initialized():
+            raise ValueError("*** SDK failed to initialize. Please check your internet connection and SDK credential.")
+        
+        _build_defaults()
+        _ai_client = LDAIClient(ldclient.get())
+        print("*** SDK successfully initialized")
+        return _ai_client
+
+def get_chat_model(config_value, tracker):
+    """Return a cached LangChain chat model for the evaluated AI Config, building it on a miss"""
+    # tracker carries the config key, variation key and version; a new variation means the config was edited
+    config_key = getattr(tracker, "_config_key", None)
+    variation = (getattr(tracker, "_variation_key", None), getattr(tracker, "_version", None))
+    model_config = config_value.model.to_dict()
+    parameters = model_config.get("parameters") or {}
+    key = (
+        config_key,
+        config_value.provider.name,
+        model_config["name"],
+        json.dumps(parameters, sort_keys=True)
     )
 
-    # # Optionally, you can use a disabled AIConfig
-    # default_value = AIConfig(
-    #     enabled=False
-    # )
+    with _chat_models_lock:
+        if variation != _chat_models_variations.get(config_key):
+            for cached_key in [cached_key for cached_key in _chat_models if cached_key[0] == config_key]:
+                del _chat_models[cached_key]
+            _chat_models_variations[config_key] = variation
+
+        llm = _chat_models.get(key)
+        if llm is None:
+            print("Model config:", config_value.model.__dict__)
+            print("Provider config:", config_value.provider.__dict__)
+            # Map the provider from config_value to LangChain format
+            langchain_provider = map_provider_to_langchain(config_value.provider.name)
+            try:
+                with metrics.span("llm.init_model"):
+                    llm = init_chat_model(
+                        model=config_value.model.name,
+                        model_provider=langchain_provider,
+                        **parameters
+                    )
+            except Exception as model_init_error:
+                print("Error initializing LLM:", str(model_init_error))
+                raise
+            _chat_models[key] = llm
+        return llm
+
+def to_langchain_messages(config_value, user_input):
+    """Convert the AI Config messages to LangChain format and append the user message"""
+    from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+    langchain_messages = []
+    for message in (config_value.messages or []):
+        msg_dict = message.to_dict()
+        if msg_dict['role'] == 'system':
+            langchain_messages.append(SystemMessage(content=msg_dict['content']))
+        elif msg_dict['role'] == 'assistant':
+            langchain_messages.append(AIMessage(content=msg_dict['content']))
+        elif msg_dict['role'] == 'user':
+            langchain_messages.append(HumanMessage(content=msg_dict['content']))
+
+    # Add the new user message
+    langchain_messages.append(HumanMessage(content=user_input))
+    return langchain_messages
+
+def _evaluate_config(key=None):
+    """Evaluate an AI Config, returning (config_value, tracker) or (None, None) when it is disabled"""
+    aiclient = init_ld_client()
     
-    config_value, tracker = aiclient.config(
-        ai_config_key,
-        context,
-        default_value,
-        {'myUserVariable': "Testing Variable"}
-    )
+    with metrics.span("launchdarkly.evaluate"):
+        config_value, tracker = aiclient.config(
+            key or ai_config_key,
+            context,
+            default_value,
+            {'myUserVariable': "Testing Variable"}
+        )
     
     if not config_value.enabled:
         print("AI Config is disabled")
-        return
+        return None, None
+    return config_value, tracker
+
+def _candidates():
+    """(config_value, tracker) for the main AI Config and the hedge one, or [] when the main one is disabled"""
+    config_value, tracker = _evaluate_config()
+    if config_value is None:
+        return []
+    candidates = [(config_value, tracker)]
+    if hedge_config_key:
+        hedge_value, hedge_tracker = _evaluate_config(hedge_config_key)
+        if hedge_value is not None:
+            candidates.append((hedge_value, hedge_tracker))
+    return candidates
 
+def _request_response(user_input, config_value, tracker, cancel):
     try:
-        # Create LangChain model instance using init_chat_model
-        # Map the provider from config_value to LangChain format
-        print("Model config:", config_value.model.__dict__)
-        print("Provider config:", config_value.provider.__dict__)
-        langchain_provider = map_provider_to_langchain(config_value.provider.name)
-        # print("Mapped provider:", langchain_provider)
-        
-        try:
-            llm = init_chat_model(
-                model=config_value.model.name,
-                model_provider=langchain_provider,
-            )
-            # print("LLM initialized successfully:", llm)
-        except Exception as model_init_error:
-            print("Error initializing LLM:", str(model_init_error))
-            raise
-        
-        # Convert messages to LangChain format
-        langchain_messages = []
-        for message in (config_value.messages or []):
-            msg_dict = message.to_dict()
-            if msg_dict['role'] == 'system':
-                langchain_messages.append(SystemMessage(content=msg_dict['content']))
-            elif msg_dict['role'] == 'assistant':
-                langchain_messages.append(AIMessage(content=msg_dict['content']))
-            elif msg_dict['role'] == 'user':
-                langchain_messages.append(HumanMessage(content=msg_dict['content']))
-        
-        # Add the new user message
-        langchain_messages.append(HumanMessage(content=user_input))
+        # Reuse the LangChain model instance built for this variation
+        llm = get_chat_model(config_value, tracker)
+        langchain_messages = to_langchain_messages(config_value, user_input)
                 
         # Get AI response
-        completion = track_langchain_metrics(tracker, lambda: llm.invoke(langchain_messages))
-        ai_response = completion.content
+        if stream_responses:
+            completion = track_langchain_metrics(tracker, lambda: stream_until_coordinates(llm, langchain_messages, cancel))
+        else:
+            completion = track_langchain_metrics(tracker, lambda: llm.invoke(langchain_messages))
+        ai_response = completion.text()
 
         return {"response": ai_response, "model": config_value.model.name, "provider": config_value.provider.name}
 
     except Exception as e:
         return {"error": str(e)}
 
+def get_ai_response(user_input, user_id="example-user", user_name="Anonymous"):
+    """Handle AI interaction with LaunchDarkly configuration"""
+    candidates = _candidates()
+    if not candidates:
+        return
+    return router.call(candidates, lambda config_value, tracker, cancel: _request_response(user_input, config_value, tracker, cancel))
+
+def _coordinates_result(coordinates, model_info):
+    if not coordinates:
+        return {"error": "No coordinates in the AI response", **model_info}
+    return {"latitude": float(coordinates["latitude"]), "longitude": float(coordinates["longitude"]), **model_info}
+
+def _request_coordinates(user_input, config_value, tracker, cancel):
+    model_info = {"model": config_value.model.name, "provider": config_value.provider.name}
+    try:
+        llm = get_chat_model(config_value, tracker)
+        langchain_messages = to_langchain_messages(config_value, user_input)
+
+        try:
+            structured_llm = llm.with_structured_output(COORDINATES_SCHEMA, include_raw=True)
+        except NotImplementedError:
+            # Models without tool calling answer in free text, parsed as it streams
+            completion = track_langchain_metrics(tracker, lambda: stream_until_coordinates(llm, langchain_messages, cancel))
+            return _coordinates_result(find_coordinates(completion.text()), model_info)
+
+        # Streamed rather than invoked so a losing hedge stops when its cancel event is set
+        result = {}
+        def stream():
+            result.update(stream_structured(structured_llm, llm, langchain_messages, cancel))
+            return result["raw"]  # carries usage_metadata for the tracker
+        track_langchain_metrics(tracker, stream)
+        return _coordinates_result(result["parsed"], model_info)
+
+    except Exception as e:
+        return {"error": str(e), **model_info}
+
+def get_ai_coordinates(user_input):
+    """Ask the AI Config for a {latitude, longitude} object as structured output, hedging to the alternate model"""
+    candidates = _candidates()
+    if not candidates:
+        return
+    return router.call(candidates, lambda config_value, tracker, cancel: _request_coordinates(user_input, config_value, tracker, cancel))
+
+async def _request_coordinates_async(user_input, config_value, tracker):
+    model_info = {"model": config_value.model.name, "provider": config_value.provider.name}
+    try:
+        llm = get_chat_model(config_value, tracker)
+        langchain_messages = to_langchain_messages(config_value, user_input)
+
+        try:
+            structured_llm = llm.with_structured_output(COORDINATES_SCHEMA, include_raw=True)
+        except NotImplementedError:
+            completion = await track_langchain_metrics_async(
+                tracker, lambda: astream_until_coordinates(llm, langchain_messages)
+            )
+            return _coordinates_result(find_coordinates(completion.text()), model_info)
+
+        result = {}
+        async def ainvoke():
+            result.update(await structured_llm.ainvoke(langchain_messages))
+            return result["raw"]
+        await track_langchain_metrics_async(tracker, ainvoke)
+        return _coordinates_result(result["parsed"], model_info)
+
+    except Exception as e:
+        return {"error": str(e), **model_info}
+
+async def init_ld_client_async():
+    """init_ld_client on a worker thread, so the SDK imports and connection wait don't block the event loop"""
+    if _ai_client is not None:
+        return _ai_client
+    return await asyncio.to_thread(init_ld_client)
+
+async def get_ai_coordinates_async(user_input):
+    """get_ai_coordinates using ainvoke/astream, for the async serving mode; a losing hedge is cancelled"""
+    await init_ld_client_async()
+    candidates = _candidates()
+    if not candidates:
+        return
+    return await router.call_async(candidates, lambda config_value, tracker: _request_coordinates_async(user_input, config_value, tracker))
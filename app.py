@@ -1,18 +1,28 @@
 from flask import Flask
 from dotenv import load_dotenv
-from routes import register_routes
 import os
 
-# Load environment variables
+# Load environment variables before the services read them at import time
 load_dotenv()
 
-def create_app():
-    """Create and configure the Flask application"""
+from routes import register_routes, prewarm
+
+def create_app(prewarm_services=None):
+    """Create and configure the Flask application.
+
+    LaunchDarkly, LangChain and the Notion client are set up on first use; with
+    APP_PREWARM=true (set by gunicorn.conf.py) that work is done here instead.
+    """
     app = Flask(__name__)
     app.secret_key = "secret-key-random-string"  # For flash messages
 
     register_routes(app)
-    
+
+    if prewarm_services is None:
+        prewarm_services = os.getenv("APP_PREWARM", "false").lower() in ("1", "true", "yes")
+    if prewarm_services:
+        prewarm(app)
+
     return app
 
 # Create the app instance
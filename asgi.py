@@ -0,0 +1,36 @@
+"""Async serving mode: the diary as a Quart (ASGI) app.
+
+    hypercorn asgi:app --bind 0.0.0.0:5002
+
+Notion, Tabelog and the LLM are awaited on one event loop instead of holding a
+thread each. app.py remains the synchronous Flask entry point.
+"""
+from quart import Quart
+from dotenv import load_dotenv
+
+# Load environment variables before the services read them at import time
+load_dotenv()
+
+import os
+from async_routes import register_routes, notion_service
+from routes import prewarm
+
+def create_app(prewarm_services=None):
+    """Create and configure the Quart application; APP_PREWARM=true does first-use setup here, as in app.py"""
+    app = Quart(__name__)
+    app.secret_key = "secret-key-random-string"  # For flash messages
+
+    register_routes(app)
+
+    if prewarm_services is None:
+        prewarm_services = os.getenv("APP_PREWARM", "false").lower() in ("1", "true", "yes")
+    if prewarm_services:
+        prewarm(app)
+        notion_service.notion
+
+    return app
+
+app = create_app()
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5002)
@@ -0,0 +1,241 @@
+"""The Quart twins of the routes in routes.py.
+
+Views here only await their I/O; parsing, validation, template contexts and response
+bodies come from the shared helpers in routes.py, so the two apps answer alike.
+"""
+from quart import render_template, request, jsonify, redirect, url_for, flash, g, session
+from notion_service import AsyncNotionService
+from ingest_queue import AsyncIngestWorker, make_async_entry_handler
+from routes import (
+    READ_ONLY_ENDPOINTS, SERVE_STATIC_EXPORT, export_rebuilder, geocode_cache, ingest_pool,
+    marker_index, response_cache, static_export,
+    _bulk_import_status, _bulk_import_upload, _cache_body, _cacheable, _cached, _database_info_response,
+    _entries_payload, _entry_query_args, _export_path, _job_status, _map_context, _markers_payload, _metrics_response,
+    _next_page_args, _received_message, _record_request, _resume_bulk_import, _start_bulk_import,
+    _start_request_trace, _submission, _submitted, _viewport_args, _webhook_check, _webhook_failed
+)
+import aiconfigs
+import metrics
+import routes
+import os
+
+# Shares the entry store, change feed, job queue, caches and marker index with the WSGI app's services
+notion_service = AsyncNotionService(store=routes.notion_service.store, changes=routes.notion_service.changes)
+
+ingest_worker = AsyncIngestWorker(
+    ingest_pool.queue,
+    make_async_entry_handler(notion_service, geocode_cache),
+    concurrency=int(os.getenv("INGEST_CONCURRENCY", "100"))
+)
+
+async def _cache_generation():
+    """routes._cache_generation for the async services"""
+    if not _cacheable(session):
+        return None
+    if response_cache.stale_while_revalidate and response_cache.version is not None:
+        response_cache.revalidate_async(notion_service.data_version)
+        return response_cache.generation
+    version = await notion_service.data_version()
+    return response_cache.validate(version) if version is not None else None
+
+def _render_export(changed_ids):
+    # Runs on the rebuilder's thread. The Flask app has the same templates and URL map, and renders
+    # synchronously, as the static_export.py command does
+    from app import app as flask_app
+    return routes.export_files(flask_app, changed_ids)
+
+def register_routes(app):
+    """Register the async twins of routes.register_routes on a Quart app"""
+
+    @app.before_serving
+    async def start_ingest_worker():
+        ingest_worker.start()
+        # Polls with the sync client on its own thread; changes reach this app through the shared feed
+        routes.start_host_services()
+        # Connect LaunchDarkly before the first submission, off the event loop
+        try:
+            await aiconfigs.init_ld_client_async()
+        except ValueError as e:
+            print(f"AI client not initialized yet: {e}")
+
+    @app.after_serving
+    async def stop_ingest_worker():
+        ingest_worker.stop()
+
+    if metrics.ENABLED:
+        # Async hooks run in the request's task; Quart would run sync ones in a thread,
+        # where the trace would not reach the view
+        @app.before_request
+        async def start_request_trace():
+            _start_request_trace(g)
+
+        @app.after_request
+        async def record_request(response):
+            return _record_request(request, g, response)
+
+    if SERVE_STATIC_EXPORT:
+        export_rebuilder.render = _render_export
+
+        @app.before_request
+        async def serve_static_export():
+            """Answer reads from the static export and refuse writes while it is being served"""
+            if request.endpoint in READ_ONLY_ENDPOINTS:
+                return 'The diary is read-only while it is served from a static export', 503
+            path = _export_path(request, session)
+            if path:
+                return await static_export.send_async(request, path)
+
+        @app.route('/export/<path:path>')
+        async def export_file(path):
+            """Any exported file, e.g. /export/entries/<id>.json"""
+            return await static_export.send_async(request, path) or ('Not found', 404)
+
+    @app.route('/metrics')
+    async def metrics_endpoint():
+        """Prometheus scrape endpoint"""
+        return _metrics_response()
+
+    @app.route('/')
+    async def index():
+        """Main page with form and one page of entries"""
+        generation = await _cache_generation()
+        cached = _cached(request, generation)
+        if cached:
+            return cached
+
+        try:
+            entries, next_cursor = await notion_service.query_entries(**_entry_query_args(request.args))
+        except ValueError as e:
+            await flash(str(e), 'error')
+            return redirect(url_for('index'))
+        next_page = _next_page_args(request.args, next_cursor)
+        next_url = url_for('index', **next_page) if next_page else None
+
+        # Rendered in one piece: Jinja's async streaming sends every small chunk as its own ASGI
+        # message, which cut throughput roughly tenfold in benchmarks/load_test.py --asgi
+        body = await render_template('python_frontend.html', entries=entries, next_url=next_url)
+        return _cache_body(request, generation, body.encode(), 'text/html; charset=utf-8')
+
+    @app.route('/map')
+    async def map():
+        """Map page"""
+        generation = await _cache_generation()
+        cached = _cached(request, generation)
+        if cached:
+            return cached
+
+        context = _map_context()
+        if context is None:
+            await flash('Google Maps API key not configured', 'error')
+            return redirect(url_for('index'))
+        body = await render_template('map.html', **context)
+        return _cache_body(request, generation, body.encode(), 'text/html; charset=utf-8')
+
+    @app.route('/api/markers')
+    async def api_markers():
+        """Markers in a viewport, clustered at low zoom levels"""
+        try:
+            viewport = _viewport_args(request.args)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        generation = await _cache_generation()
+        cached = _cached(request, generation)
+        if cached:
+            return cached
+
+        version = await notion_service.data_version()
+        if version is None or version != marker_index.version:
+            entries = [entry async for entry in notion_service.iter_entries()]
+            marker_index.ensure_fresh(version, lambda: entries)
+        response = jsonify(_markers_payload(*viewport))
+        return _cache_body(request, generation, await response.get_data(), response.content_type)
+
+    @app.route('/add_entry', methods=['POST'])
+    async def add_entry():
+        """Handle form submission"""
+        try:
+            payload = _submission(await request.form)
+        except ValueError as e:
+            await flash(str(e), 'error')
+            return redirect(url_for('index'))
+
+        # Geocoding, scraping and the Notion write run as a task on this event loop
+        job_id = ingest_worker.submit(payload)
+        response = _submitted(job_id, url_for('job_status', job_id=job_id), request.accept_mimetypes)
+        if response:
+            return response
+        await flash(_received_message(job_id), 'success')
+        return redirect(url_for('index'))
+
+    @app.route('/api/jobs/<job_id>')
+    async def job_status(job_id):
+        """Status of a queued entry submission"""
+        return _job_status(ingest_worker.queue, job_id)
+
+    @app.route('/delete_entry/<entry_id>')
+    async def delete_entry(entry_id):
+        """Delete an entry"""
+        success, message = await notion_service.delete_entry(entry_id)
+        await flash(message, 'success' if success else 'error')
+        return redirect(url_for('index'))
+
+    @app.route('/api/entries')
+    async def api_entries():
+        """Paginated, filtered and sorted entries as JSON"""
+        try:
+            return _entries_payload(*await notion_service.query_entries(**_entry_query_args(request.args)))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+    @app.route('/api/bulk_import', methods=['POST'])
+    async def bulk_import():
+        """Start a background import of an uploaded CSV/JSONL file of Tabelog links"""
+        upload = (await request.files).get('file')
+        try:
+            import_id, path = _bulk_import_upload(upload)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        await upload.save(path)
+        # Bulk imports are rate limited batch work, so they keep running on the sync services' threads
+        _start_bulk_import(import_id, path)
+        return {"import_id": import_id, "status_url": url_for('bulk_import_status', import_id=import_id)}, 202
+
+    @app.route('/api/bulk_import/<import_id>')
+    async def bulk_import_status(import_id):
+        """Progress of a bulk import"""
+        return _bulk_import_status(import_id)
+
+    @app.route('/api/bulk_import/<import_id>/resume', methods=['POST'])
+    async def resume_bulk_import(import_id):
+        """Re-run an import, skipping rows its checkpoint already marks done"""
+        return _resume_bulk_import(import_id)
+
+    @app.route('/api/notion/webhook', methods=['POST'])
+    async def notion_webhook():
+        """Receive Notion webhook events for pages in the diary database"""
+        event = await request.get_json(silent=True) or {}
+        response = _webhook_check(event, await request.get_data(), request.headers.get('X-Notion-Signature'))
+        if response:
+            return response
+        try:
+            await notion_service.apply_webhook_event(event)
+        except Exception as e:
+            return _webhook_failed(e)
+        return {}, 200
+
+    @app.route('/api/debug/geocode_cache')
+    async def debug_geocode_cache():
+        """Debug endpoint to see how many LLM geocoding calls the cache saved"""
+        return geocode_cache.stats()
+
+    @app.route('/api/debug/models')
+    async def debug_models():
+        """Debug endpoint to see the rolling latency and error stats the model router hedges on"""
+        return aiconfigs.router.summary()
+
+    @app.route('/api/debug/database')
+    async def debug_database():
+        """Debug endpoint to see database properties"""
+        return _database_info_response(*await notion_service.get_database_info())
+    return app
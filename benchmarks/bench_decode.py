@@ -0,0 +1,85 @@
+"""Time and size the Notion page decoders per 1k pages.
+
+Run from the repository root:
+
+    python benchmarks/bench_decode.py [--pages 1000] [--repeat 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from entry_model import decode_page
+from fakes import make_page
+
+def decode_to_dicts(pages):
+    """The per-page nested-dict decoding get_entries used before the Entry model, for comparison"""
+    entries = []
+    for page in pages:
+        entry = {"id": page["id"], "title": "", "url": "", "notion_url": page["url"], "content": "",
+                 "created_time": page.get("created_time", ""), "tabelog_data": {}}
+        properties = page.get("properties", {})
+        tabelog_data = {}
+        if "Link" in properties and properties["Link"]["type"] == "url" and properties["Link"]["url"]:
+            entry["title"] = entry["url"] = properties["Link"]["url"]
+        if "Notes" in properties and properties["Notes"]["type"] == "rich_text" and properties["Notes"]["rich_text"]:
+            entry["content"] = properties["Notes"]["rich_text"][0]["plain_text"]
+        if "Date" in properties and properties["Date"]["type"] == "date" and properties["Date"]["date"]:
+            entry["date"] = properties["Date"]["date"]["start"]
+        if "Name" in properties and properties["Name"]["type"] == "title" and properties["Name"]["title"]:
+            tabelog_data["name"] = properties["Name"]["title"][0]["plain_text"]
+        if "Rating" in properties and properties["Rating"]["type"] == "number" and properties["Rating"]["number"] is not None:
+            tabelog_data["rating"] = properties["Rating"]["number"]
+        if "Category" in properties and properties["Category"]["type"] == "rich_text" and properties["Category"]["rich_text"]:
+            text = properties["Category"]["rich_text"][0]["plain_text"]
+            tabelog_data["categories"] = [cat.strip() for cat in text.split(",")]
+        if "Address" in properties and properties["Address"]["type"] == "rich_text" and properties["Address"]["rich_text"]:
+            tabelog_data["address"] = properties["Address"]["rich_text"][0]["plain_text"]
+        for name, key in (("Latitude", "latitude"), ("Longitude", "longitude")):
+            if name in properties and properties[name]["type"] == "number" and properties[name]["number"] is not None:
+                entry[key] = properties[name]["number"]
+        if "AI_Model" in properties and properties["AI_Model"]["type"] == "rich_text" and properties["AI_Model"]["rich_text"]:
+            entry["ai_model_info"] = properties["AI_Model"]["rich_text"][0]["plain_text"]
+        entry["tabelog_data"] = tabelog_data
+        entries.append(entry)
+    return entries
+
+DECODERS = {
+    "dicts": decode_to_dicts,
+    "Entry list": lambda pages: [decode_page(page) for page in pages],
+}
+
+def retained_kib(decoder, pages):
+    """Memory still held by the decoded result, in KiB"""
+    tracemalloc.start()
+    result = decoder(pages)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = [make_page(i) for i in range(args.pages)]
+    print(f"{'decoder':<12}{'ms / 1k pages':>15}{'retained KiB':>15}")
+    for name, decoder in DECODERS.items():
+        decoder(pages)  # warm up
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            decoder(pages)
+            samples.append((time.perf_counter() - start) * 1000 * 1000 / args.pages)
+        print(f"{name:<12}{statistics.median(samples):>15.2f}{retained_kib(decoder, pages):>15.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare the lxml and BeautifulSoup Tabelog parsers on the saved fixtures.
+
+Run from the repository root:
+
+    python benchmarks/bench_parse.py [--iterations 50]
+"""
+import argparse
+import glob
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+sys.path.insert(0, ROOT)
+# Parsing only; don't create the response cache or snapshot databases
+os.environ.setdefault("TABELOG_CACHE_PATH", "")
+os.environ.setdefault("TABELOG_SNAPSHOT_PATH", "")
+
+from tabelog_scraper import parse_tabelog
+
+ENGINES = ("lxml", "soup")
+
+def time_engine(html, engine, iterations):
+    """Median and p95 wall time in milliseconds for one parse"""
+    parse_tabelog(html, engine)  # warm up caches and compiled selectors
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        parse_tabelog(html, engine)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+# Runs in a fresh interpreter per engine, so one engine's peak can't hide the other's. Reads the
+# process's own high-water mark (Linux): getrusage's ru_maxrss keeps the parent's peak across exec
+CHILD = """
+import sys
+from bs4 import BeautifulSoup
+from tabelog_scraper import parse_tabelog
+
+def peak_rss():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+
+with open(sys.argv[1], encoding="utf-8") as f:
+    html = f.read()
+before = peak_rss()
+parse_tabelog(html, sys.argv[2])
+print(peak_rss() - before)
+"""
+
+def rss_peak(path, engine):
+    """Growth in peak RSS during one parse in KiB, including libxml2's allocations outside the Python heap"""
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, path, engine],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return int(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'fixture':<26}{'engine':<8}{'size KiB':>10}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'RSS KiB':>11}  same result")
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        expected = parse_tabelog(html, "soup")
+        for engine in ENGINES:
+            p50, p95 = time_engine(html, engine, args.iterations)
+            print(f"{os.path.basename(path):<26}{engine:<8}{len(html.encode()) / 1024:>10.0f}"
+                  f"{p50:>10.2f}{p95:>10.2f}{rss_peak(path, engine):>11}"
+                  f"  {parse_tabelog(html, engine) == expected}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Offline stand-ins for Notion, Tabelog and the chat model used by the benchmarks."""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import httpx
+import requests
+from requests.adapters import BaseAdapter
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+CATEGORIES = ["甘味処", "パフェ", "和菓子", "カフェ", "ケーキ", "ラーメン", "居酒屋", "バー"]
+PREFECTURES = [("kyoto", 35.0116, 135.7681), ("tokyo", 35.6812, 139.7671), ("osaka", 34.7025, 135.4959)]
+
+def _text(value):
+    return [{"type": "text", "text": {"content": value}, "plain_text": value}]
+
+def _timestamp(moment):
+    # Notion reports times rounded to the minute
+    return moment.replace(second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M:00.000Z")
+
+def make_page(index, created=None):
+    """Build a database page shaped like the diary's Notion schema"""
+    prefecture, lat, lng = random.choice(PREFECTURES)
+    created = created or datetime.now(timezone.utc) - timedelta(hours=index)
+    number = 26000000 + index
+    link = f"https://tabelog.com/{prefecture}/A2601/A260201/{number}/"
+    return {
+        "object": "page",
+        "id": str(uuid.UUID(int=index + 1)),
+        "url": f"https://www.notion.so/{index:032x}",
+        "created_time": _timestamp(created),
+        "last_edited_time": _timestamp(created),
+        "archived": False,
+        "properties": {
+            "Link": {"id": "a", "type": "url", "url": link},
+            "Notes": {"id": "b", "type": "rich_text", "rich_text": _text(f"Entry {index}: the matcha parfait was lovely.")},
+            "Date": {"id": "c", "type": "date", "date": {"start": created.isoformat()}},
+            "Name": {"id": "title", "type": "title", "title": _text(f"甘味処 {index}")},
+            "Rating": {"id": "d", "type": "number", "number": round(random.uniform(3.0, 4.5), 2)},
+            "Category": {"id": "e", "type": "rich_text", "rich_text": _text(", ".join(random.sample(CATEGORIES, 2)))},
+            "Address": {"id": "f", "type": "rich_text", "rich_text": _text(f"{prefecture} 1-{index}")},
+            "Latitude": {"id": "g", "type": "number", "number": lat + random.uniform(-0.05, 0.05)},
+            "Longitude": {"id": "h", "type": "number", "number": lng + random.uniform(-0.05, 0.05)},
+            "AI_Model": {"id": "i", "type": "rich_text", "rich_text": _text("openai")},
+        }
+    }
+
+def _read_property(value):
+    """Turn a property as written by pages.create into the shape Notion returns"""
+    for kind in ("url", "number", "date"):
+        if kind in value:
+            return {"type": kind, kind: value[kind]}
+    for kind in ("title", "rich_text"):
+        if kind in value:
+            content = value[kind][0]["text"]["content"] if value[kind] else ""
+            return {"type": kind, kind: _text(content) if content else []}
+    return value
+
+class FakeNotionServer:
+    """Threaded HTTP server implementing the Notion endpoints NotionService uses"""
+
+    def __init__(self, entries=500, latency=0.1):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.pages = [make_page(i) for i in range(entries)]
+        self.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def query(self, body):
+        with self.lock:
+            pages = [page for page in self.pages if not page["archived"]]
+        timestamp_filter = (body.get("filter") or {}).get("last_edited_time")
+        if timestamp_filter and "on_or_after" in timestamp_filter:
+            pages = [page for page in pages if page["last_edited_time"] >= timestamp_filter["on_or_after"]]
+        for sort in reversed(body.get("sorts") or []):
+            key = sort.get("timestamp")
+            if key:
+                pages.sort(key=lambda page: page[key], reverse=sort["direction"] == "descending")
+        start = int(body.get("start_cursor") or 0)
+        size = min(int(body.get("page_size") or 100), 100)
+        chunk = pages[start:start + size]
+        has_more = start + size < len(pages)
+        return {
+            "object": "list",
+            "results": chunk,
+            "has_more": has_more,
+            "next_cursor": str(start + size) if has_more else None
+        }
+
+    def create(self, body):
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            page = make_page(len(self.pages), created=now)
+            page["properties"] = {
+                name: _read_property(value) for name, value in body.get("properties", {}).items()
+            }
+            self.pages.append(page)
+        return page
+
+    def retrieve(self, page_id):
+        with self.lock:
+            for page in self.pages:
+                if page["id"] == page_id:
+                    return page
+        return None
+
+    def update(self, page_id, body):
+        with self.lock:
+            for page in self.pages:
+                if page["id"] == page_id:
+                    page["archived"] = body.get("archived", page["archived"])
+                    page["properties"].update(
+                        (name, _read_property(value)) for name, value in body.get("properties", {}).items()
+                    )
+                    page["last_edited_time"] = _timestamp(datetime.now(timezone.utc))
+                    return page
+        return None
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _dispatch(self, method):
+                time.sleep(fake.latency)
+                with fake.lock:
+                    fake.requests += 1
+                body = self._body() if method in ("POST", "PATCH") else {}
+                # Routes match the path alone; e.g. queries pass filter_properties in the query string
+                path = urlsplit(self.path).path
+                if method == "POST" and re.match(r"^/v1/databases/[^/]+/query$", path):
+                    return self._reply(200, fake.query(body))
+                if method == "POST" and path == "/v1/pages":
+                    return self._reply(200, fake.create(body))
+                match = re.match(r"^/v1/pages/([^/]+)$", path)
+                if method in ("GET", "PATCH") and match:
+                    page = fake.retrieve(match.group(1)) if method == "GET" else fake.update(match.group(1), body)
+                    return self._reply(200 if page else 404, page or {"object": "error", "code": "object_not_found"})
+                if method == "GET" and re.match(r"^/v1/databases/[^/]+$", path):
+                    return self._reply(200, {"object": "database", "title": [], "properties": fake.pages[0]["properties"]})
+                self._reply(404, {"object": "error", "code": "object_not_found", "message": path})
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PATCH(self):
+                self._dispatch("PATCH")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+class FixtureTabelogAdapter(BaseAdapter):
+    """requests transport adapter that answers Tabelog URLs with the saved HTML fixtures"""
+
+    def __init__(self, latency=0.2, fixture="tabelog_desktop.html"):
+        super().__init__()
+        self.latency = latency
+        with open(os.path.join(FIXTURES, fixture), "rb") as f:
+            self.body = f.read()
+
+    def send(self, request, **kwargs):
+        time.sleep(self.latency)
+        response = requests.Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        response.headers["Content-Type"] = "text/html; charset=utf-8"
+        response._content = self.body
+        return response
+
+    def close(self):
+        pass
+
+def fixture_transport(latency=0.2, fixture="tabelog_desktop.html"):
+    """httpx transport answering Tabelog URLs with a saved HTML fixture, for the async scraper"""
+    with open(os.path.join(FIXTURES, fixture), "rb") as f:
+        body = f.read()
+
+    async def handler(request):
+        await asyncio.sleep(latency)
+        return httpx.Response(200, content=body, headers={"Content-Type": "text/html; charset=utf-8"})
+    return httpx.MockTransport(handler)
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that sleeps for a fixed latency and replies with a coordinate pair"""
+
+    latency: float = 1.0
+    reply: str = (
+        "The restaurant is at {35.0036, 135.7786}. It sits on a quiet lane in Higashiyama, "
+        "a short walk from Yasaka Shrine, and is best known for its seasonal matcha parfaits."
+    )
+
+    @property
+    def _llm_type(self):
+        return "fake-latency"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        message = AIMessage(
+            content=self.reply,
+            usage_metadata={"input_tokens": 42, "output_tokens": 14, "total_tokens": 56}
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def get_token_ids(self, text):
+        # Word-sized tokens, as streamed; estimates for cut-off streams count with these
+        return list(range(len(text.split())))
+
+    def _tokens(self):
+        return re.findall(r"\S+\s*", self.reply)
+
+    def _chunk(self, token, index, tokens):
+        # Usage arrives in the final chunk, like OpenAI
+        usage = None
+        if index == len(tokens) - 1:
+            usage = {"input_tokens": 42, "output_tokens": len(tokens), "total_tokens": 42 + len(tokens)}
+        return ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Spread the latency evenly over word-sized tokens
+        tokens = self._tokens()
+        for index, token in enumerate(tokens):
+            time.sleep(self.latency / len(tokens))
+            yield self._chunk(token, index, tokens)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = self._tokens()
+        for index, token in enumerate(tokens):
+            await asyncio.sleep(self.latency / len(tokens))
+            yield self._chunk(token, index, tokens)
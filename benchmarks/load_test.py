@@ -0,0 +1,215 @@
+"""Load-test the Flask routes against offline stand-ins for Notion, Tabelog and the LLM.
+
+Run from the repository root:
+
+    python benchmarks/load_test.py --concurrency 16 --requests 200 --llm-latency 1.0
+    python benchmarks/load_test.py --asgi ...   # serve asgi.py with Hypercorn instead
+
+Nothing leaves the machine: Notion is a local fake API server, Tabelog pages come
+from benchmarks/fixtures and LaunchDarkly runs offline with a fake chat model.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from werkzeug.serving import make_server
+from fakes import FakeChatModel, FakeNotionServer, FixtureTabelogAdapter, fixture_transport
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def configure_environment(args, notion, workdir):
+    """Point every service at the stand-ins before the app modules are imported"""
+    os.environ.update({
+        "NOTION_BASE_URL": notion.base_url,
+        "NOTION_TOKEN": "fake-token",
+        "NOTION_DATABASE_ID": "fake-database",
+        "NOTION_SYNC_INTERVAL": str(args.sync_interval),
+        "LAUNCHDARKLY_OFFLINE": "true",
+        "GOOGLE_MAPS_API": "fake-maps-key",
+        "ENTRY_STORE_PATH": os.path.join(workdir, "entries.db"),
+        "INGEST_QUEUE_PATH": os.path.join(workdir, "jobs.db"),
+        "GEOCODE_CACHE_PATH": os.path.join(workdir, "geocode_cache.db"),
+        "TABELOG_CACHE_PATH": "",
+        "TABELOG_SNAPSHOT_PATH": os.path.join(workdir, "tabelog_snapshots.db"),
+        "BULK_IMPORT_DIR": os.path.join(workdir, "imports"),
+        "SERVICES_LOCK_PATH": os.path.join(workdir, "services.lock"),
+    })
+    if args.static_export:
+        os.environ.update({
+            "SERVE_STATIC_EXPORT": "true",
+            "STATIC_EXPORT_DIR": os.path.join(workdir, "export"),
+            "STATIC_EXPORT_DELAY": "0",
+        })
+
+def start_app(args):
+    """Import the app with the fakes wired in and serve it on a local port"""
+    import aiconfigs
+    import tabelog_scraper
+
+    aiconfigs.init_chat_model = lambda **kwargs: FakeChatModel(latency=args.llm_latency)
+    adapter = FixtureTabelogAdapter(latency=args.tabelog_latency)
+    tabelog_scraper.session.mount("https://tabelog.com/", adapter)
+    tabelog_scraper.session.mount("https://s.tabelog.com/", adapter)
+
+    if args.asgi:
+        return start_asgi_app(args)
+
+    from app import create_app
+    app = create_app()
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+class _AsgiServer:
+    """Hypercorn serving asgi.app on its own event loop thread, stopped like a werkzeug server"""
+
+    def __init__(self, app, port):
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+        config = Config()
+        config.bind = [f"127.0.0.1:{port}"]
+        config.accesslog = None
+        self.loop = asyncio.new_event_loop()
+        self.stopped = asyncio.Event()
+        self.thread = threading.Thread(
+            target=self.loop.run_until_complete,
+            args=(serve(app, config, shutdown_trigger=self.stopped.wait),),
+            daemon=True
+        )
+        self.thread.start()
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.stopped.set)
+        self.thread.join(timeout=5)
+
+def start_asgi_app(args):
+    import httpx
+    import tabelog_scraper
+    tabelog_scraper._async_client = httpx.AsyncClient(transport=fixture_transport(latency=args.tabelog_latency))
+
+    from asgi import app
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = _AsgiServer(app, port)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(base_url + "/api/debug/geocode_cache", timeout=1)
+            break
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    return server, base_url
+
+def drive(base_url, route, total, concurrency):
+    """Send `total` requests to a route from `concurrency` threads and time each one"""
+    local = threading.local()
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+
+    def one_request(_):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        with counter_lock:
+            index = next(counter)
+        start = time.perf_counter()
+        if route == "/add_entry":
+            response = local.session.post(
+                base_url + route,
+                data={"link_url": f"https://tabelog.com/kyoto/A2601/A260201/{27000000 + index}/", "notes": "benchmark"},
+                headers={"Accept": "application/json"}
+            )
+        else:
+            response = local.session.get(base_url + route)
+            response.content  # include streamed body time
+        return time.perf_counter() - start, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one_request, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency * 1000 for latency, _ in results]
+    errors = sum(1 for _, status in results if status >= 400)
+    return {
+        "route": route,
+        "requests": total,
+        "errors": errors,
+        "throughput": total / elapsed,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "mean": statistics.fmean(latencies),
+    }
+
+def wait_for_jobs(timeout):
+    """Wait for queued submissions to finish and return (done, failed, seconds)"""
+    import routes
+    queue = routes.ingest_pool.queue
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        with queue.lock:
+            counts = dict(queue.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        if not counts.get("queued") and not counts.get("running"):
+            break
+        time.sleep(0.1)
+    return counts.get("done", 0), counts.get("failed", 0), time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--routes", nargs="+", default=["/", "/map", "/add_entry"])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="requests per route")
+    parser.add_argument("--entries", type=int, default=500, help="pages in the fake Notion database")
+    parser.add_argument("--notion-latency", type=float, default=0.1, help="seconds per fake Notion call")
+    parser.add_argument("--tabelog-latency", type=float, default=0.2, help="seconds per fixture fetch")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per fake LLM call")
+    parser.add_argument("--sync-interval", type=float, default=30, help="NOTION_SYNC_INTERVAL for the app")
+    parser.add_argument("--asgi", action="store_true", help="serve the async Quart app (asgi.py) with Hypercorn")
+    parser.add_argument("--static-export", action="store_true", help="serve reads from the static export (Flask only)")
+    args = parser.parse_args()
+
+    notion = FakeNotionServer(entries=args.entries, latency=args.notion_latency).start()
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args, notion, workdir)
+        server, base_url = start_app(args)
+        try:
+            # One warm-up request so the initial full sync isn't charged to the first route
+            requests.get(base_url + "/")
+            if args.static_export:
+                # The first request starts the export build; wait for it to be published
+                while not os.path.exists(os.path.join(workdir, "export", "current")):
+                    time.sleep(0.1)
+
+            print(f"{'route':<12}{'reqs':>6}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+            for route in args.routes:
+                result = drive(base_url, route, args.requests, args.concurrency)
+                print(f"{result['route']:<12}{result['requests']:>6}{result['errors']:>8}{result['throughput']:>9.1f}"
+                      f"{result['p50']:>10.1f}{result['p95']:>10.1f}{result['p99']:>10.1f}")
+
+            if "/add_entry" in args.routes:
+                done, failed, seconds = wait_for_jobs(timeout=args.requests * args.llm_latency + 60)
+                print(f"ingestion: {done} saved, {failed} failed, queue drained in {seconds:.1f}s after the last submission")
+            print(f"fake Notion API calls: {notion.requests}")
+        finally:
+            server.shutdown()
+            notion.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Time app startup in fresh interpreters: importing app.py (which calls create_app()) and the deferred work.
+
+Run from the repository root:
+
+    python benchmarks/startup.py [--runs 10] [--asgi]
+
+Each run is a new process, so module imports are cold as they are for a new
+worker. "prewarm" is what APP_PREWARM=true (gunicorn.conf.py) adds to startup;
+without it, the first request and first submission pay that cost instead.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+{module}.create_app()
+created = time.perf_counter()
+import routes
+routes.prewarm({module}.app)
+prewarmed = time.perf_counter()
+print(json.dumps({{
+    "import + create_app": imported - start,
+    "create_app()": created - imported,
+    "prewarm": prewarmed - created,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+def run_once(module, env):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(module=module)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--asgi", action="store_true", help="time asgi.py instead of app.py")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            APP_PREWARM="false",
+            LAUNCHDARKLY_OFFLINE="1",
+            ENTRY_STORE_PATH=os.path.join(tmp, "entries.db"),
+            GEOCODE_CACHE_PATH=os.path.join(tmp, "geocode.db"),
+            INGEST_QUEUE_PATH=os.path.join(tmp, "jobs.db"),
+            TABELOG_CACHE_PATH=os.path.join(tmp, "tabelog_cache.db"),
+            TABELOG_SNAPSHOT_PATH=os.path.join(tmp, "tabelog_snapshots.db"),
+        )
+        module = "asgi" if args.asgi else "app"
+        run_once(module, env)  # bytecode compilation and the page cache
+        runs = [run_once(module, env) for _ in range(args.runs)]
+
+    print(f"{module}: median of {args.runs} fresh processes")
+    for name in ("import + create_app", "create_app()", "prewarm"):
+        print(f"  {name:20} {statistics.median(run[name] for run in runs) * 1000:8.1f} ms")
+    print(f"  {'max RSS':20} {statistics.median(run['rss_mb'] for run in runs):8.1f} MB")
+
+if __name__ == "__main__":
+    main()
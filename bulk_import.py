@@ -0,0 +1,146 @@
+import argparse
+import csv
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Load credentials before aiconfigs reads them at import time
+load_dotenv()
+
+from geocode_cache import GeocodeCache
+from geocoder import geocode, resolve_coordinates
+from notion_service import NotionService
+from rate_limit import NOTION_REQUESTS_PER_SECOND, TokenBucket
+from tabelog_scraper import scrape_tabelog
+
+def read_rows(path):
+    """Read {link_url, notes} rows from a CSV (url/link_url, notes columns) or JSONL file"""
+    rows = []
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            records = csv.DictReader(f)
+        for record in records:
+            link_url = (record.get("link_url") or record.get("url") or "").strip()
+            if link_url:
+                rows.append({"link_url": link_url, "notes": (record.get("notes") or "").strip()})
+    return rows
+
+class Checkpoint:
+    """Append-only JSONL log of finished rows so an interrupted import can resume"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        if record["status"] == "done":
+                            self.done.add((record["row"], record["link_url"]))
+
+    def is_done(self, index, row):
+        return (index, row["link_url"]) in self.done
+
+    def record(self, index, row, status, error=None):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "row": index, "link_url": row["link_url"], "status": status, "error": error
+                }) + "\n")
+            if status == "done":
+                self.done.add((index, row["link_url"]))
+
+class BulkImporter:
+    """Scrape, geocode and save many Tabelog links with bounded concurrency and rate limits"""
+
+    def __init__(self, notion_service, geocode_cache=None, scrape_workers=8, geocode_workers=4,
+                 llm_requests_per_second=2, notion_requests_per_second=NOTION_REQUESTS_PER_SECOND):
+        self.notion_service = notion_service
+        self.geocode_cache = geocode_cache
+        self.scrape_workers = scrape_workers
+        self.geocode_workers = geocode_workers
+        self.llm_limiter = TokenBucket(llm_requests_per_second)
+        self.notion_limiter = TokenBucket(notion_requests_per_second, capacity=1)
+        self.progress = {"total": 0, "skipped": 0, "done": 0, "failed": 0, "finished": False}
+
+    def run(self, rows, checkpoint, on_progress=None):
+        """Import rows not already marked done in the checkpoint and return the progress counts"""
+        self.progress.update(total=len(rows), skipped=0, done=0, failed=0, finished=False)
+        pending = []
+        for index, row in enumerate(rows):
+            if checkpoint.is_done(index, row):
+                self.progress["skipped"] += 1
+            elif not self.notion_service.validate_url(row["link_url"]):
+                self._finish(checkpoint, index, row, "failed", "Not a Tabelog URL", on_progress)
+            else:
+                pending.append((index, row))
+
+        with ThreadPoolExecutor(self.scrape_workers, thread_name_prefix="bulk-scrape") as scrapers, \
+                ThreadPoolExecutor(self.geocode_workers, thread_name_prefix="bulk-geocode") as geocoders:
+            jobs = [
+                (index, row,
+                 scrapers.submit(scrape_tabelog, row["link_url"]),
+                 geocoders.submit(geocode, row["link_url"], self.geocode_cache, self.llm_limiter))
+                for index, row in pending
+            ]
+            # Notion writes stay on this thread, one at a time, behind the token bucket
+            for index, row, scrape_future, geocode_future in jobs:
+                try:
+                    tabelog_data = scrape_future.result()
+                    latitude, longitude, model_info = resolve_coordinates(row["link_url"], geocode_future, tabelog_data)
+                    self.notion_limiter.acquire()
+                    success, message = self.notion_service.create_entry(
+                        row["link_url"], row["notes"], latitude, longitude,
+                        ai_model_info=model_info, tabelog_data=tabelog_data
+                    )
+                except Exception as e:
+                    success, message = False, str(e)
+                status = "done" if success else "failed"
+                self._finish(checkpoint, index, row, status, None if success else message, on_progress)
+
+        self.progress["finished"] = True
+        if on_progress:
+            on_progress(self.progress)
+        return self.progress
+
+    def _finish(self, checkpoint, index, row, status, error, on_progress):
+        checkpoint.record(index, row, status, error)
+        self.progress[status] += 1
+        if on_progress:
+            on_progress(self.progress)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import Tabelog links into the Notion diary")
+    parser.add_argument("path", help="CSV with url/link_url and notes columns, or JSONL with the same keys")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <path>.checkpoint.jsonl)")
+    parser.add_argument("--scrape-workers", type=int, default=8)
+    parser.add_argument("--geocode-workers", type=int, default=4)
+    parser.add_argument("--llm-rps", type=float, default=2, help="LLM requests per second")
+    args = parser.parse_args()
+
+    importer = BulkImporter(
+        NotionService(),
+        GeocodeCache(os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.db")),
+        scrape_workers=args.scrape_workers,
+        geocode_workers=args.geocode_workers,
+        llm_requests_per_second=args.llm_rps
+    )
+    checkpoint = Checkpoint(args.checkpoint or f"{args.path}.checkpoint.jsonl")
+
+    def report(progress):
+        print(f"\r{progress['done']} done, {progress['failed']} failed, "
+              f"{progress['skipped']} skipped of {progress['total']}", end="", flush=True)
+
+    progress = importer.run(read_rows(args.path), checkpoint, on_progress=report)
+    print()
+    if progress["failed"]:
+        print(f"Failed rows are listed in {checkpoint.path}; run the same command again to retry them.")
+
+if __name__ == "__main__":
+    main()
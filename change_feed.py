@@ -0,0 +1,99 @@
+import hashlib
+import hmac
+import threading
+import time
+from dataclasses import dataclass
+from entry_model import Entry
+import metrics
+
+UPSERT = "upsert"
+ARCHIVE = "archive"
+
+# Notion webhook events after which a page is re-read; page.deleted archives it without a read
+PAGE_EVENTS = {"page.created", "page.properties_updated", "page.content_updated", "page.moved", "page.undeleted"}
+
+@dataclass(slots=True, frozen=True)
+class Change:
+    """An entry that was added or edited (UPSERT), or the ID of one that is gone (ARCHIVE)"""
+    kind: str
+    entry_id: str
+    entry: Entry = None
+
+class ChangeFeed:
+    """Fans entry changes out to subscribers such as the marker index and response cache"""
+
+    def __init__(self):
+        self.subscribers = []
+        # True while a ChangePoller keeps the store fresh, so reads needn't sync first
+        self.polling = False
+
+    def subscribe(self, callback):
+        """Call callback(changes, version) for each batch, with the store version after it was applied"""
+        self.subscribers.append(callback)
+        return callback
+
+    def publish(self, changes, version=None):
+        if not changes:
+            return
+        for change in changes:
+            metrics.entry_changes.inc(change.kind)
+        for callback in self.subscribers:
+            try:
+                callback(changes, version)
+            except Exception as e:
+                print(f"Error handling entry changes: {e}")
+
+class ChangePoller:
+    """Background thread that pulls Notion edits into the store every `interval` seconds"""
+
+    def __init__(self, notion_service, interval=10, reconcile_interval=3600):
+        self.notion_service = notion_service
+        self.interval = interval
+        # Deletions don't show up in an edited-since query, so the full ID list is compared occasionally
+        self.reconcile_interval = reconcile_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start polling once; a zero interval leaves syncing to reads as before"""
+        if self._thread is not None or self.interval <= 0 or self.notion_service.store is None:
+            return
+        self._thread = threading.Thread(target=self._run, name="notion-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.notion_service.changes.polling = False
+
+    def _run(self):
+        last_reconcile = time.monotonic()
+        while True:
+            try:
+                self.notion_service.sync(force=True)
+                # Reads keep syncing themselves until the store has caught up once
+                self.notion_service.changes.polling = True
+                if self.reconcile_interval > 0 and time.monotonic() - last_reconcile >= self.reconcile_interval:
+                    self.notion_service.reconcile()
+                    last_reconcile = time.monotonic()
+            except Exception as e:
+                print(f"Error polling Notion for changes: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+def verify_signature(secret, body, signature):
+    """Check a webhook's X-Notion-Signature header against the raw request body"""
+    if not secret or not signature:
+        return False
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+def webhook_action(event):
+    """(UPSERT or ARCHIVE, page_id) for a Notion webhook event, or None if it doesn't concern a page"""
+    entity = event.get("entity") or {}
+    if entity.get("type") != "page" or not entity.get("id"):
+        return None
+    if event.get("type") == "page.deleted":
+        return ARCHIVE, entity["id"]
+    if event.get("type") in PAGE_EVENTS:
+        return UPSERT, entity["id"]
+    return None
@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import threading
+
+# Bumped in each forked child, so connections opened before a fork (e.g. in a
+# gunicorn --preload master) are reopened rather than shared with the parent
+_fork_generation = 0
+
+def _forked():
+    global _fork_generation
+    _fork_generation += 1
+
+os.register_at_fork(after_in_child=_forked)
+
+def _open(path):
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class Connection:
+    """A sqlite3 connection that reopens itself in a forked child; attribute access goes to the current one"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = _open(path)
+        self._generation = _fork_generation
+        # Handles inherited from the parent; kept open since closing them in the child would disturb the parent's locks
+        self._inherited = []
+
+    def _current(self):
+        if self._generation != _fork_generation:
+            with self._lock:
+                if self._generation != _fork_generation:
+                    self._inherited.append(self._conn)
+                    self._conn = _open(self.path)
+                    self._generation = _fork_generation
+        return self._conn
+
+    def __getattr__(self, name):
+        return getattr(self._current(), name)
+
+def connect(path):
+    """Open a SQLite connection that can be shared across Flask worker threads and survives a pre-fork"""
+    return Connection(path)
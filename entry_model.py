@@ -0,0 +1,154 @@
+from dataclasses import dataclass
+
+def _plain_text(kind):
+    def decode(prop):
+        items = prop[kind]
+        return items[0]["plain_text"] if items else None
+    def encode(value):
+        return {kind: [{"type": "text", "text": {"content": value}}]}
+    return decode, encode
+
+def _scalar(kind):
+    def decode(prop):
+        return prop[kind]
+    def encode(value):
+        return {kind: value}
+    return decode, encode
+
+def _decode_date(prop):
+    return prop["date"]["start"] if prop["date"] else None
+
+def _encode_date(value):
+    return {"date": {"start": value}}
+
+# Notion property type -> (decode raw property to a value, encode a value to a property)
+CODECS = {
+    "url": _scalar("url"),
+    "number": _scalar("number"),
+    "rich_text": _plain_text("rich_text"),
+    "title": _plain_text("title"),
+    "date": (_decode_date, _encode_date),
+}
+
+def _split_categories(text):
+    return tuple(cat.strip() for cat in text.split(","))
+
+def _join_categories(categories):
+    return ", ".join(categories)
+
+class Property:
+    """Maps one Notion database property onto an Entry field"""
+    __slots__ = ("name", "type", "field", "decode", "encode")
+
+    def __init__(self, name, type, field, to_field=None, from_field=None):
+        self.name = name
+        self.type = type
+        self.field = field
+        decode, encode = CODECS[type]
+        # Optional converters between the Notion value and the Entry field value
+        self.decode = (lambda prop: to_field(decode(prop))) if to_field else decode
+        self.encode = (lambda value: encode(from_field(value))) if from_field else encode
+
+# The diary database schema, used both to decode pages and to build create_entry properties
+SCHEMA = (
+    Property("Link", "url", "url"),
+    Property("Notes", "rich_text", "content"),
+    Property("Date", "date", "date"),
+    Property("Name", "title", "name"),
+    Property("Rating", "number", "rating"),
+    Property("Category", "rich_text", "categories", _split_categories, _join_categories),
+    Property("Address", "rich_text", "address"),
+    Property("Latitude", "number", "latitude"),
+    Property("Longitude", "number", "longitude"),
+    Property("AI_Model", "rich_text", "ai_model_info"),
+)
+
+@dataclass(slots=True)
+class Entry:
+    """One diary entry decoded from a Notion page"""
+    id: str
+    notion_url: str = ""
+    created_time: str = ""
+    url: str = ""  # Tabelog URL
+    content: str = ""
+    date: str = None
+    name: str = None
+    rating: float = None
+    categories: tuple = ()
+    address: str = None
+    latitude: float = None
+    longitude: float = None
+    ai_model_info: str = None
+
+    @property
+    def title(self):
+        return self.url
+
+    def to_dict(self):
+        """The JSON shape served by the API and kept in the entry store"""
+        tabelog_data = {}
+        if self.name is not None:
+            tabelog_data["name"] = self.name
+        if self.rating is not None:
+            tabelog_data["rating"] = self.rating
+        if self.categories:
+            tabelog_data["categories"] = list(self.categories)
+        if self.address is not None:
+            tabelog_data["address"] = self.address
+
+        data = {
+            "id": self.id,
+            "title": self.url,
+            "url": self.url,
+            "notion_url": self.notion_url,
+            "content": self.content,
+            "created_time": self.created_time,
+            "tabelog_data": tabelog_data
+        }
+        for field in ("date", "latitude", "longitude", "ai_model_info"):
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        tabelog_data = data.get("tabelog_data") or {}
+        return cls(
+            id=data["id"],
+            notion_url=data.get("notion_url", ""),
+            created_time=data.get("created_time", ""),
+            url=data.get("url", ""),
+            content=data.get("content", ""),
+            date=data.get("date"),
+            name=tabelog_data.get("name"),
+            rating=tabelog_data.get("rating"),
+            categories=tuple(tabelog_data.get("categories") or ()),
+            address=tabelog_data.get("address"),
+            latitude=data.get("latitude"),
+            longitude=data.get("longitude"),
+            ai_model_info=data.get("ai_model_info")
+        )
+
+# Flattened SCHEMA for the decode loop
+_DECODERS = tuple((prop.name, prop.type, prop.field, prop.decode) for prop in SCHEMA)
+
+def decode_page(page):
+    """Decode a Notion page into an Entry using SCHEMA"""
+    entry = Entry(page["id"], page["url"], page.get("created_time", ""))
+    properties = page.get("properties", {})
+    for name, type, field, decode in _DECODERS:
+        raw = properties.get(name)
+        if raw is not None and raw["type"] == type:
+            value = decode(raw)
+            if value is not None:
+                setattr(entry, field, value)
+    return entry
+
+def encode_properties(**fields):
+    """Build Notion page properties from Entry field values, skipping empty ones"""
+    return {
+        prop.name: prop.encode(fields[prop.field])
+        for prop in SCHEMA
+        if fields.get(prop.field)
+    }
@@ -0,0 +1,216 @@
+import base64
+import json
+import threading
+from db import connect
+from entry_model import Entry
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT PRIMARY KEY,
+    created_time TEXT,
+    last_edited_time TEXT,
+    data TEXT NOT NULL,
+    sort_date TEXT,
+    rating REAL,
+    category TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_created_time ON entries (created_time, id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Columns pulled out of the entry JSON so queries can filter and sort in SQL
+INDEXED_COLUMNS = {
+    "sort_date": "TEXT",
+    "rating": "REAL",
+    "category": "TEXT",
+}
+
+# Sort keys exposed to callers, mapped to the SQL expression they order by
+SORT_EXPRESSIONS = {
+    "date": "sort_date",
+    "rating": "COALESCE(rating, -1)",
+}
+
+def encode_cursor(sort_value, entry_id):
+    """Pack the last row's sort key into an opaque page cursor"""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, entry_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    """Unpack a page cursor, raising ValueError if it was tampered with"""
+    try:
+        sort_value, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return sort_value, entry_id
+
+def _indexed_values(entry):
+    return entry.date or entry.created_time, entry.rating, ", ".join(entry.categories)
+
+def _load(row):
+    return Entry.from_dict(json.loads(row["data"]))
+
+class EntryStore:
+    """Local SQLite copy of the Notion diary that reads are served from"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = connect(path)
+        self.lock = threading.Lock()
+        self._writes = 0
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    @property
+    def version(self):
+        """A value that changes whenever entries are written, here or by another process"""
+        with self.lock:
+            # data_version only moves for commits made through other connections
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        return self._writes, data_version
+
+    def _migrate(self):
+        """Add indexed columns to stores created before they existed and backfill them"""
+        with self.lock:
+            existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(entries)")}
+            missing = [name for name in INDEXED_COLUMNS if name not in existing]
+            for name in missing:
+                self.conn.execute(f"ALTER TABLE entries ADD COLUMN {name} {INDEXED_COLUMNS[name]}")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_sort_date ON entries (sort_date, id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_rating ON entries (COALESCE(rating, -1), id)")
+            rows = self.conn.execute("SELECT data, last_edited_time FROM entries").fetchall() if missing else []
+        if rows:
+            self.upsert_many([(_load(row), row["last_edited_time"]) for row in rows])
+
+    def upsert(self, entry, last_edited_time=None):
+        """Insert or replace a single entry, returning [entry] if it changed"""
+        return self.upsert_many([(entry, last_edited_time)])
+
+    def upsert_many(self, items):
+        """Insert or replace (Entry, last_edited_time) pairs in one transaction, returning the entries that changed"""
+        changed = []
+        if not items:
+            return changed
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                for entry, last_edited_time in items:
+                    # Rows that come back unchanged (e.g. re-read by the next sync) are left alone
+                    cursor = self.conn.execute(
+                        "INSERT INTO entries "
+                        "(id, created_time, last_edited_time, data, sort_date, rating, category) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(id) DO UPDATE SET "
+                        "created_time = excluded.created_time, last_edited_time = excluded.last_edited_time, "
+                        "data = excluded.data, sort_date = excluded.sort_date, "
+                        "rating = excluded.rating, category = excluded.category "
+                        "WHERE entries.data != excluded.data",
+                        (entry.id, entry.created_time, last_edited_time, json.dumps(entry.to_dict()),
+                         *_indexed_values(entry))
+                    )
+                    if cursor.rowcount:
+                        changed.append(entry)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            if changed:
+                self._writes += 1
+        return changed
+
+    def delete(self, entry_id):
+        """Remove an entry, returning whether it was stored"""
+        with self.lock:
+            if self.conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,)).rowcount:
+                self._writes += 1
+                return True
+        return False
+
+    def ids(self):
+        """IDs of every stored entry"""
+        with self.lock:
+            return {row["id"] for row in self.conn.execute("SELECT id FROM entries")}
+
+    def all(self):
+        """Return every stored entry, newest first"""
+        return list(self.iter_entries())
+
+    def iter_entries(self, limit=None, batch_size=100):
+        """Yield stored entries newest first, reading one batch at a time"""
+        # Keyset pagination keeps the lock short while a caller renders each batch
+        last_key = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            with self.lock:
+                if last_key is None:
+                    rows = self.conn.execute(
+                        "SELECT id, created_time, data FROM entries "
+                        "ORDER BY created_time DESC, id DESC LIMIT ?",
+                        (size,)
+                    ).fetchall()
+                else:
+                    rows = self.conn.execute(
+                        "SELECT id, created_time, data FROM entries "
+                        "WHERE (created_time, id) < (?, ?) "
+                        "ORDER BY created_time DESC, id DESC LIMIT ?",
+                        (*last_key, size)
+                    ).fetchall()
+            for row in rows:
+                yield _load(row)
+            if len(rows) < size:
+                return
+            last_key = (rows[-1]["created_time"], rows[-1]["id"])
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def query(self, limit=50, cursor=None, sort="date", order="desc", category=None, min_rating=None):
+        """Return one page of entries and the cursor for the next page, filtered and sorted in SQL"""
+        sort_expr = SORT_EXPRESSIONS[sort]
+        direction = "DESC" if order == "desc" else "ASC"
+        where, params = [], []
+        if category:
+            # Match % and _ in the category literally
+            escaped = category.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where.append("category LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        if min_rating is not None:
+            where.append("rating >= ?")
+            params.append(min_rating)
+        if cursor:
+            where.append(f"({sort_expr}, id) {'<' if direction == 'DESC' else '>'} (?, ?)")
+            params.extend(decode_cursor(cursor))
+
+        sql = f"SELECT id, data, {sort_expr} AS sort_value FROM entries"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        # Fetch one extra row to learn whether another page exists
+        sql += f" ORDER BY {sort_expr} {direction}, id {direction} LIMIT ?"
+        params.append(limit + 1)
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["sort_value"], rows[-1]["id"])
+        return [_load(row) for row in rows], next_cursor
+
+    def get_cursor(self):
+        """Return the latest Notion last_edited_time seen by a sync"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM sync_state WHERE key = 'last_edited_time'"
+            ).fetchone()
+        return row["value"] if row else None
+
+    def set_cursor(self, last_edited_time):
+        """Persist the sync cursor"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES ('last_edited_time', ?)",
+                (last_edited_time,)
+            )
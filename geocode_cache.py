@@ -0,0 +1,112 @@
+import re
+import threading
+import time
+from urllib.parse import urlparse
+from db import connect
+import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocodes (
+    restaurant_id TEXT PRIMARY KEY,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    model TEXT,
+    provider TEXT,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS geocodes_last_access ON geocodes (last_access);
+"""
+
+# /<prefecture>/<area>/<sub-area>/<restaurant number>/, optionally behind a language prefix like /en/
+RESTAURANT_PATH = re.compile(r"^/(?:[a-z]{2}/)?([a-z]+)/A\d+/A\d+/(\d+)(?:/|$)")
+
+def restaurant_id(url):
+    """Normalize a desktop, mobile or translated Tabelog URL to 'prefecture/number', or None"""
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or "").lower()
+    if host != "tabelog.com" and not host.endswith(".tabelog.com"):
+        return None
+    match = RESTAURANT_PATH.match(parsed.path)
+    if not match:
+        return None
+    return f"{match.group(1)}/{match.group(2)}"
+
+class GeocodeCache:
+    """Persistent cache of AI geocoding results keyed by Tabelog restaurant ID"""
+
+    def __init__(self, path, ttl=30 * 24 * 3600, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.conn = connect(path)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+
+    def get(self, url):
+        """Return cached {latitude, longitude, model, provider} for a URL, or None on a miss"""
+        rid = restaurant_id(url)
+        if rid is None:
+            return None
+
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM geocodes WHERE restaurant_id = ?", (rid,)
+            ).fetchone()
+            if row and now - row["created_at"] > self.ttl:
+                self.conn.execute("DELETE FROM geocodes WHERE restaurant_id = ?", (rid,))
+                row = None
+            if row is None:
+                self.misses += 1
+                metrics.cache_lookups.inc("geocode", "miss")
+                return None
+
+            self.conn.execute(
+                "UPDATE geocodes SET last_access = ? WHERE restaurant_id = ?", (now, rid)
+            )
+            self.hits += 1
+            metrics.cache_lookups.inc("geocode", "hit")
+        return {
+            "latitude": row["latitude"],
+            "longitude": row["longitude"],
+            "model": row["model"],
+            "provider": row["provider"]
+        }
+
+    def put(self, url, latitude, longitude, model_info=None):
+        """Store coordinates for a URL, evicting least recently used rows past max_entries"""
+        rid = restaurant_id(url)
+        if rid is None:
+            return
+
+        model_info = model_info or {}
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO geocodes "
+                "(restaurant_id, latitude, longitude, model, provider, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (rid, latitude, longitude, model_info.get("model"), model_info.get("provider"), now, now)
+            )
+            self.conn.execute(
+                "DELETE FROM geocodes WHERE restaurant_id IN ("
+                "SELECT restaurant_id FROM geocodes ORDER BY last_access DESC LIMIT -1 OFFSET ?"
+                ")",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        """Hit/miss counters since startup, plus the number of cached restaurants"""
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": size
+        }
@@ -0,0 +1,149 @@
+import asyncio
+import csv
+import os
+import re
+import unicodedata
+from concurrent.futures import TimeoutError
+from urllib.parse import urlparse
+import aiconfigs
+import metrics
+
+# (south, west, north, east) around Japan's outlying islands, Okinotorishima to Bentenjima
+# and Yonaguni to Minamitorishima
+JAPAN_BOUNDS = (20.4, 122.9, 45.6, 154.0)
+
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv"))
+
+# How long an entry submission waits for the AI geocode before using the gazetteer
+GEOCODE_TIMEOUT = float(os.getenv("GEOCODE_TIMEOUT", "20"))
+
+POSTAL_CODE = re.compile(r"^〒?\d{3}-?\d{4}")
+
+def in_japan(latitude, longitude):
+    """Whether a coordinate pair falls inside JAPAN_BOUNDS"""
+    if latitude is None or longitude is None:
+        return False
+    south, west, north, east = JAPAN_BOUNDS
+    return south <= latitude <= north and west <= longitude <= east
+
+def normalize_address(address):
+    """Fold full-width characters and drop spaces and a leading postal code"""
+    address = unicodedata.normalize("NFKC", address)
+    address = re.sub(r"\s+", "", address)
+    return POSTAL_CODE.sub("", address)
+
+class Gazetteer:
+    """Offline prefecture, city and ward centroids for geocoding Tabelog addresses without an LLM"""
+
+    def __init__(self, path=GAZETTEER_PATH):
+        self.places = []  # (name, latitude, longitude), longest name first
+        self.prefectures = {}  # Tabelog URL slug -> (name, latitude, longitude)
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                place = (row["name"], float(row["latitude"]), float(row["longitude"]))
+                self.places.append(place)
+                if row["tabelog_slug"]:
+                    self.prefectures[row["tabelog_slug"]] = place
+        self.places.sort(key=lambda place: len(place[0]), reverse=True)
+
+    def lookup(self, address=None, link_url=None):
+        """Most specific (name, latitude, longitude) for an address, then the URL's prefecture, or None"""
+        if address:
+            address = normalize_address(address)
+            for place in self.places:
+                if address.startswith(place[0]):
+                    return place
+        if link_url:
+            # Tabelog paths start with the prefecture, e.g. /kyoto/A2601/...
+            path = urlparse(link_url).path.strip("/").split("/")
+            if path and path[0] in self.prefectures:
+                return self.prefectures[path[0]]
+            if len(path) > 1 and path[1] in self.prefectures:  # /en/kyoto/...
+                return self.prefectures[path[1]]
+        return None
+
+gazetteer = Gazetteer()
+
+def _cached_geocode(link_url, cache):
+    cached = cache.get(link_url) if cache is not None else None
+    if not cached:
+        return None
+    model_info = {"model": cached["model"], "provider": cached["provider"]}
+    return cached["latitude"], cached["longitude"], model_info
+
+def _checked_geocode(link_url, ai_response, cache):
+    """Validate an AI geocode reply and cache it, returning (latitude, longitude, model_info)"""
+    if not ai_response or "error" in ai_response:
+        print(f"Error geocoding {link_url}: {ai_response}")
+        return None, None, {"model": "Unknown", "provider": "Unknown"}
+
+    latitude, longitude = ai_response["latitude"], ai_response["longitude"]
+    model_info = {"model": ai_response["model"], "provider": ai_response["provider"]}
+    if not in_japan(latitude, longitude):
+        print(f"Discarding geocode outside Japan for {link_url}: {latitude}, {longitude}")
+        return None, None, model_info
+
+    if cache is not None:
+        cache.put(link_url, latitude, longitude, model_info)
+    return latitude, longitude, model_info
+
+def geocode(link_url, cache=None, limiter=None):
+    """Ask the AI Config for the restaurant coordinates, returning (latitude, longitude, model_info)"""
+    cached = _cached_geocode(link_url, cache)
+    if cached:
+        return cached
+
+    if limiter is not None:
+        limiter.acquire()
+    return _checked_geocode(link_url, aiconfigs.get_ai_coordinates(link_url), cache)
+
+async def geocode_async(link_url, cache=None):
+    """geocode for the async serving mode"""
+    cached = _cached_geocode(link_url, cache)
+    if cached:
+        return cached
+    return _checked_geocode(link_url, await aiconfigs.get_ai_coordinates_async(link_url), cache)
+
+def fallback_geocode(link_url, address=None):
+    """Geocode from the scraped address or the URL's prefecture using the gazetteer"""
+    place = gazetteer.lookup(address, link_url)
+    if place is None:
+        return None, None, {"model": "Unknown", "provider": "Unknown"}
+    name, latitude, longitude = place
+    return latitude, longitude, {"model": name, "provider": "gazetteer"}
+
+def resolve_coordinates(link_url, geocode_future, tabelog_data, timeout=None):
+    """Wait up to timeout for the AI geocode, falling back to the gazetteer when it is slow or unusable"""
+    try:
+        latitude, longitude, model_info = geocode_future.result(timeout=timeout)
+    except TimeoutError:
+        print(f"AI geocode for {link_url} took longer than {timeout}s, using the gazetteer")
+        metrics.geocode_fallbacks.inc("timeout")
+        return fallback_geocode(link_url, (tabelog_data or {}).get("address"))
+    except Exception as e:
+        # e.g. LaunchDarkly not configured or the model call failing; the entry still gets saved
+        print(f"AI geocode for {link_url} failed, using the gazetteer: {e}")
+        metrics.geocode_fallbacks.inc("error")
+        return fallback_geocode(link_url, (tabelog_data or {}).get("address"))
+    if latitude is not None and longitude is not None:
+        return latitude, longitude, model_info
+    metrics.geocode_fallbacks.inc("no_result")
+    return fallback_geocode(link_url, (tabelog_data or {}).get("address"))
+
+async def resolve_coordinates_async(link_url, geocode_task, tabelog_data, timeout=None):
+    """resolve_coordinates for an asyncio task; a slow geocode keeps running so its result still gets cached"""
+    try:
+        latitude, longitude, model_info = await asyncio.wait_for(asyncio.shield(geocode_task), timeout)
+    except asyncio.TimeoutError:
+        print(f"AI geocode for {link_url} took longer than {timeout}s, using the gazetteer")
+        metrics.geocode_fallbacks.inc("timeout")
+        return fallback_geocode(link_url, (tabelog_data or {}).get("address"))
+    except Exception as e:
+        # e.g. LaunchDarkly not configured or the model call failing; the entry still gets saved
+        print(f"AI geocode for {link_url} failed, using the gazetteer: {e}")
+        metrics.geocode_fallbacks.inc("error")
+        return fallback_geocode(link_url, (tabelog_data or {}).get("address"))
+    if latitude is not None and longitude is not None:
+        return latitude, longitude, model_info
+    metrics.geocode_fallbacks.inc("no_result")
+    return fallback_geocode(link_url, (tabelog_data or {}).get("address"))
@@ -0,0 +1,32 @@
+"""Production serving for the Flask app.
+
+    gunicorn -c gunicorn.conf.py
+
+The app is imported and pre-warmed once in the master, then forked, so workers
+start instantly and share its modules, templates and marker index copy-on-write.
+"""
+import gc
+import os
+
+wsgi_app = "app:app"
+bind = os.getenv("BIND", "0.0.0.0:5002")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Recycled workers are forked from the warm master instead of importing everything again
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+preload_app = True
+
+# Read by create_app() when the master imports app.py
+os.environ.setdefault("APP_PREWARM", "true")
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach, so collections
+    # in the workers don't write to (and un-share) the master's pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    # Threads don't survive fork(), so each worker starts its own ingest workers and LaunchDarkly
+    # client; one of them also takes SERVICES_LOCK_PATH and runs the Notion poller and Tabelog scheduler
+    from routes import start_services
+    start_services()
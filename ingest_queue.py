@@ -0,0 +1,265 @@
+import asyncio
+import contextvars
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from db import connect
+import metrics
+from geocoder import GEOCODE_TIMEOUT, geocode, geocode_async, resolve_coordinates, resolve_coordinates_async
+from tabelog_scraper import scrape_tabelog, scrape_tabelog_async
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+class JobQueue:
+    """Persistent SQLite queue of entry submissions waiting to be processed"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = connect(path)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+
+    def enqueue(self, payload):
+        """Store a new job and return its ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(payload), now, now)
+            )
+        return job_id
+
+    def claim(self):
+        """Mark the oldest queued job as running and return (job_id, payload), or None"""
+        # A single UPDATE ... RETURNING keeps the claim atomic across processes
+        with self.lock:
+            row = self.conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ("
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ") RETURNING id, payload",
+                (time.time(),)
+            ).fetchone()
+        if not row:
+            return None
+        return row["id"], json.loads(row["payload"])
+
+    def complete(self, job_id, result):
+        """Record a finished job"""
+        self._finish(job_id, "done", result=json.dumps(result))
+
+    def fail(self, job_id, error):
+        """Record a failed job"""
+        self._finish(job_id, "failed", error=error)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id)
+            )
+
+    def get(self, job_id):
+        """Return a job's status as a dict, or None if it doesn't exist"""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"]
+        }
+
+    def queued(self):
+        """Number of jobs waiting for a worker"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def requeue_stale(self, older_than):
+        """Put jobs left running by a crashed worker back in the queue"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? "
+                "WHERE status = 'running' AND updated_at < ?",
+                (time.time(), time.time() - older_than)
+            )
+        return cursor.rowcount
+
+class IngestWorkerPool:
+    """Background threads that drain a JobQueue through a handler function"""
+
+    def __init__(self, queue, handler, workers=2, stale_after=300):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.stale_after = stale_after
+        self._wakeup = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads once, recovering jobs orphaned by a previous run"""
+        if self._threads:
+            return
+        self.queue.requeue_stale(self.stale_after)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, payload):
+        """Queue a job and wake a worker, returning the job ID"""
+        job_id = self.queue.enqueue(payload)
+        self._wakeup.set()
+        return job_id
+
+    def _run(self):
+        while True:
+            job = self.queue.claim()
+            if job is None:
+                # Poll occasionally too, in case another process queued work
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+                continue
+
+            job_id, payload = job
+            start = time.perf_counter()
+            try:
+                self.queue.complete(job_id, self.handler(payload))
+                status = "done"
+            except Exception as e:
+                print(f"Error processing job {job_id}: {e}")
+                self.queue.fail(job_id, str(e))
+                status = "failed"
+            metrics.job_seconds.observe(time.perf_counter() - start, status)
+
+class AsyncIngestWorker:
+    """Drains a JobQueue as asyncio tasks on the server's event loop, up to `concurrency` jobs at once"""
+
+    def __init__(self, queue, handler, concurrency=100, stale_after=300):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.stale_after = stale_after
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._jobs = set()  # the loop only keeps weak references to tasks
+
+    def start(self):
+        """Start the dispatcher on the running event loop, recovering jobs orphaned by a previous run"""
+        if self._task is not None:
+            return
+        self.queue.requeue_stale(self.stale_after)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        """Cancel the dispatcher and running jobs; start() requeues jobs left running"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        for task in list(self._jobs):
+            task.cancel()
+        self._task = None
+
+    def submit(self, payload):
+        """Queue a job and wake the dispatcher, returning the job ID"""
+        job_id = self.queue.enqueue(payload)
+        self._wakeup.set()
+        return job_id
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            await slots.acquire()
+            job = self.queue.claim()
+            if job is None:
+                slots.release()
+                # Poll occasionally too, in case another process queued work
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            task = asyncio.create_task(self._process(job, slots))
+            self._jobs.add(task)
+            task.add_done_callback(self._jobs.discard)
+
+    async def _process(self, job, slots):
+        job_id, payload = job
+        start = time.perf_counter()
+        try:
+            self.queue.complete(job_id, await self.handler(payload))
+            status = "done"
+        except Exception as e:
+            print(f"Error processing job {job_id}: {e}")
+            self.queue.fail(job_id, str(e))
+            status = "failed"
+        finally:
+            slots.release()
+        metrics.job_seconds.observe(time.perf_counter() - start, status)
+
+# Shared by all jobs so the geocode and scrape steps of one job run side by side
+_step_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ingest-step")
+
+def make_entry_handler(notion_service, geocode_cache=None):
+    """Build the job handler that geocodes, scrapes and saves a submitted entry"""
+    def handle(payload):
+        link_url = payload["link_url"]
+        spans = metrics.start_trace()
+        # The AI geocode and the Tabelog scrape don't depend on each other; running them in a
+        # copy of this context records their spans in the job's trace
+        geocode_future = _step_executor.submit(contextvars.copy_context().run, geocode, link_url, geocode_cache)
+        scrape_future = _step_executor.submit(contextvars.copy_context().run, scrape_tabelog, link_url)
+        tabelog_data = scrape_future.result()
+        latitude, longitude, model_info = resolve_coordinates(link_url, geocode_future, tabelog_data, GEOCODE_TIMEOUT)
+
+        success, message = notion_service.create_entry(
+            link_url, payload["notes"], latitude, longitude,
+            ai_model_info=model_info, tabelog_data=tabelog_data
+        )
+        if not success:
+            raise RuntimeError(message)
+        return {"message": message, "latitude": latitude, "longitude": longitude,
+                "timings": metrics.span_totals(spans)}
+    return handle
+
+def make_async_entry_handler(notion_service, geocode_cache=None):
+    """make_entry_handler for the async serving mode, taking an AsyncNotionService"""
+    async def handle(payload):
+        link_url = payload["link_url"]
+        spans = metrics.start_trace()
+        geocode_task = asyncio.create_task(geocode_async(link_url, geocode_cache))
+        tabelog_data = await scrape_tabelog_async(link_url)
+        latitude, longitude, model_info = await resolve_coordinates_async(
+            link_url, geocode_task, tabelog_data, GEOCODE_TIMEOUT
+        )
+
+        success, message = await notion_service.create_entry(
+            link_url, payload["notes"], latitude, longitude,
+            ai_model_info=model_info, tabelog_data=tabelog_data
+        )
+        if not success:
+            raise RuntimeError(message)
+        return {"message": message, "latitude": latitude, "longitude": longitude,
+                "timings": metrics.span_totals(spans)}
+    return handle
+
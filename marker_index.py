@@ -0,0 +1,178 @@
+import math
+import threading
+import metrics
+from change_feed import UPSERT
+
+# Above this zoom level every entry is returned as its own marker
+CLUSTER_MAX_ZOOM = 15
+
+# Grid cells per 256px map tile; 4 gives clusters roughly 64px apart on screen
+CELLS_PER_TILE = 4
+
+def cell_size(zoom):
+    """Width of a grid cell in degrees at a zoom level"""
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+def _cell(lat, lng, size):
+    return math.floor((lng + 180.0) / size), math.floor((lat + 90.0) / size)
+
+def entry_to_marker(entry):
+    """Marker dict for an entry with coordinates, or None"""
+    if not (entry.latitude and entry.longitude):
+        return None
+    return {
+        'id': entry.id,
+        'lat': entry.latitude,
+        'lng': entry.longitude,
+        'title': entry.name or 'Restaurant',
+        'url': entry.url,  # Tabelog URL
+        'notion_url': entry.notion_url
+    }
+
+class MarkerIndex:
+    """Grid index over entry coordinates with a precomputed cluster layer per zoom level"""
+
+    def __init__(self):
+        self.version = object()
+        self.lock = threading.Lock()
+        self._layers = {}
+        self._markers = {}
+        self._by_id = None  # entry ID -> marker, once built
+
+    def ensure_fresh(self, version, load_entries):
+        """Rebuild from load_entries() unless the index already reflects this data version"""
+        with self.lock:
+            if version is not None and version == self.version:
+                metrics.cache_lookups.inc("marker_index", "hit")
+                return
+            metrics.cache_lookups.inc("marker_index", "rebuild")
+            with metrics.span("marker_index.build"):
+                self._build(load_entries())
+            self.version = version
+
+    def apply(self, changes, version=None):
+        """Patch the index in place for a batch of change-feed changes instead of rebuilding it"""
+        with self.lock:
+            if self._by_id is None:
+                return  # the first ensure_fresh builds it
+            with metrics.span("marker_index.apply"):
+                for change in changes:
+                    self._remove(change.entry_id)
+                    if change.kind == UPSERT:
+                        marker = entry_to_marker(change.entry)
+                        if marker is not None:
+                            self._add(marker)
+            self.version = version
+
+    def _add(self, marker):
+        self._by_id[marker['id']] = marker
+        self._markers.setdefault(_cell(marker['lat'], marker['lng'], cell_size(CLUSTER_MAX_ZOOM + 1)), []).append(marker)
+        for zoom, cells in self._layers.items():
+            key = _cell(marker['lat'], marker['lng'], cell_size(zoom))
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [1, marker['lat'], marker['lng'], marker]
+            else:
+                cell[0] += 1
+                cell[1] += marker['lat']
+                cell[2] += marker['lng']
+
+    def _remove(self, entry_id):
+        marker = self._by_id.pop(entry_id, None)
+        if marker is None:
+            return
+        key = _cell(marker['lat'], marker['lng'], cell_size(CLUSTER_MAX_ZOOM + 1))
+        self._markers[key].remove(marker)
+        if not self._markers[key]:
+            del self._markers[key]
+        for zoom, cells in self._layers.items():
+            key = _cell(marker['lat'], marker['lng'], cell_size(zoom))
+            cell = cells[key]
+            cell[0] -= 1
+            if cell[0] == 0:
+                del cells[key]
+            elif cell[0] == 1:
+                # A single marker is served as itself, so find the one left behind
+                remaining = self._only_marker_in(zoom, key)
+                cells[key] = [1, remaining['lat'], remaining['lng'], remaining]
+            else:
+                cell[1] -= marker['lat']
+                cell[2] -= marker['lng']
+
+    def _only_marker_in(self, zoom, key):
+        size = cell_size(zoom)
+        west, south = key[0] * size - 180.0, key[1] * size - 90.0
+        for _, markers in self._cells_in(self._markers, cell_size(CLUSTER_MAX_ZOOM + 1), south, west, south + size, west + size):
+            for marker in markers:
+                if _cell(marker['lat'], marker['lng'], size) == key:
+                    return marker
+
+    def _build(self, entries):
+        layers = {zoom: {} for zoom in range(CLUSTER_MAX_ZOOM + 1)}
+        markers = {}
+        by_id = {}
+        marker_size = cell_size(CLUSTER_MAX_ZOOM + 1)
+        for entry in entries:
+            marker = entry_to_marker(entry)
+            if marker is None:
+                continue
+            by_id[marker['id']] = marker
+            markers.setdefault(_cell(marker['lat'], marker['lng'], marker_size), []).append(marker)
+            for zoom, cells in layers.items():
+                key = _cell(marker['lat'], marker['lng'], cell_size(zoom))
+                cell = cells.get(key)
+                if cell is None:
+                    cells[key] = [1, marker['lat'], marker['lng'], marker]
+                else:
+                    cell[0] += 1
+                    cell[1] += marker['lat']
+                    cell[2] += marker['lng']
+        self._layers = layers
+        self._markers = markers
+        self._by_id = by_id
+
+    def query(self, south, west, north, east, zoom):
+        """Markers and clusters inside a bounding box at a zoom level"""
+        with self.lock:
+            if zoom > CLUSTER_MAX_ZOOM:
+                return self._query_markers(south, west, north, east)
+            return self._query_clusters(south, west, north, east, zoom)
+
+    def _cells_in(self, cells, size, south, west, north, east):
+        min_x, min_y = _cell(south, west, size)
+        max_x, max_y = _cell(north, east, size)
+        span = (max_x - min_x + 1) * (max_y - min_y + 1)
+        if span < len(cells):
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    if (x, y) in cells:
+                        yield (x, y), cells[(x, y)]
+        else:
+            for key, cell in cells.items():
+                if min_x <= key[0] <= max_x and min_y <= key[1] <= max_y:
+                    yield key, cell
+
+    def _query_clusters(self, south, west, north, east, zoom):
+        results = []
+        for (x, y), (count, lat_sum, lng_sum, marker) in self._cells_in(
+                self._layers[zoom], cell_size(zoom), south, west, north, east):
+            if count == 1:
+                results.append(dict(marker, type='marker'))
+            else:
+                results.append({
+                    'type': 'cluster',
+                    'id': f'cluster:{zoom}:{x}:{y}',
+                    'lat': lat_sum / count,
+                    'lng': lng_sum / count,
+                    'count': count
+                })
+        return results
+
+    def _query_markers(self, south, west, north, east):
+        results = []
+        for _, markers in self._cells_in(self._markers, cell_size(CLUSTER_MAX_ZOOM + 1), south, west, north, east):
+            results.extend(
+                dict(marker, type='marker') for marker in markers
+                if south <= marker['lat'] <= north and west <= marker['lng'] <= east
+            )
+        return results
@@ -0,0 +1,167 @@
+import contextvars
+import os
+import threading
+import time
+
+# METRICS_ENABLED=false turns spans and counters into no-ops
+ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Seconds; covers sub-millisecond cache lookups up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels)
+    return "{" + pairs + "}"
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        if not ENABLED:
+            return
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(zip(self.labels, label_values))} {value}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, *label_values):
+        if not ENABLED:
+            return
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_values, series in sorted(self.series.items()):
+                labels = list(zip(self.labels, label_values))
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+class Gauge:
+    """Value read from a callback at scrape time, e.g. a cache's current size"""
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+        registry.append(self)
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+registry = []
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+request_seconds = Histogram("sweetski_request_seconds", "Route latency until the response is returned", ("method", "route", "status"))
+span_seconds = Histogram("sweetski_span_seconds", "Duration of external calls and parse stages", ("span",))
+span_errors = Counter("sweetski_span_errors_total", "Spans that raised, by exception type", ("span", "error"))
+job_seconds = Histogram("sweetski_job_seconds", "Entry submission processing time", ("status",))
+cache_lookups = Counter("sweetski_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"))
+llm_seconds = Histogram("sweetski_llm_seconds", "LLM call latency by model and outcome", ("model", "status"))
+llm_hedges = Counter("sweetski_llm_hedges_total", "Hedged LLM requests launched, and which model answered first", ("event",))
+llm_tokens = Counter("sweetski_llm_tokens_total", "LLM tokens reported to LaunchDarkly", ("kind",))
+entry_changes = Counter("sweetski_entry_changes_total", "Entry upserts and archives published on the change feed", ("kind",))
+geocode_fallbacks = Counter("sweetski_geocode_fallbacks_total", "Entries geocoded with the gazetteer instead of the AI", ("reason",))
+
+# Spans recorded during the current request or job, as a list of (name, seconds)
+_trace = contextvars.ContextVar("trace", default=None)
+
+def start_trace():
+    """Begin collecting spans for the current request or job; returns the list they are appended to"""
+    spans = []
+    _trace.set(spans)
+    return spans
+
+def span_totals(spans):
+    """Milliseconds per span name, for attaching a breakdown to a job result"""
+    totals = {}
+    for name, seconds in spans:
+        totals[name] = round(totals.get(name, 0) + seconds * 1000, 1)
+    return totals
+
+def server_timing(spans):
+    """Format recorded spans as a Server-Timing header value"""
+    return ", ".join(f'{name.replace(".", "-")};dur={seconds * 1000:.1f}' for name, seconds in spans)
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        span_seconds.observe(seconds, self.name)
+        if exc_type is not None:
+            span_errors.inc(self.name, exc_type.__name__)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append((self.name, seconds))
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def span(name):
+    """Time a block as a named span: `with metrics.span("notion.create"): ...`"""
+    return _Span(name) if ENABLED else _NO_SPAN
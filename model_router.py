@@ -0,0 +1,206 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import metrics
+
+def model_key(config_value):
+    """Label a model by provider and name, e.g. "openai/gpt-4o" """
+    return f"{config_value.provider.name}/{config_value.model.name}"
+
+class ModelStats:
+    """Rolling latency and error record for one model, fed from its LaunchDarkly tracker summaries"""
+
+    def __init__(self, window=100):
+        self.latencies = deque(maxlen=window)  # seconds, successful calls only
+        self.outcomes = deque(maxlen=window)  # True for success, False for error
+        self.lock = threading.Lock()
+
+    def record(self, seconds, success):
+        with self.lock:
+            if success is not None:
+                self.outcomes.append(success)
+            if success is not False and seconds is not None:
+                self.latencies.append(seconds)
+
+    def percentile(self, q):
+        """Latency below which a fraction q of recent calls finished, or None without samples"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    @property
+    def samples(self):
+        return len(self.latencies)
+
+    @property
+    def error_rate(self):
+        with self.lock:
+            return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def summary(self):
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "samples": self.samples,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+        }
+
+class ModelRouter:
+    """Calls the fastest healthy model and hedges to an alternate when it runs past its p95.
+
+    Candidates are (config_value, tracker) pairs from evaluating AI Configs, so each call is
+    reported to LaunchDarkly under its own config and model.
+    """
+
+    def __init__(self, min_samples=20, default_deadline=2.0, min_deadline=0.25, max_error_rate=0.5, workers=8):
+        self.min_samples = min_samples  # calls before a model's p95 is trusted
+        self.default_deadline = default_deadline  # hedge delay until then
+        self.min_deadline = min_deadline
+        self.max_error_rate = max_error_rate  # models failing more often than this are tried last
+        self.workers = workers
+        self.stats = {}
+        self.lock = threading.Lock()
+        self._executor = None
+
+    def stats_for(self, model):
+        with self.lock:
+            stats = self.stats.get(model)
+            if stats is None:
+                stats = self.stats[model] = ModelStats()
+            return stats
+
+    def order(self, candidates):
+        """Candidates with healthy models first, then by p95; unmeasured models keep their configured order"""
+        def rank(item):
+            index, (config_value, _) = item
+            stats = self.stats_for(model_key(config_value))
+            p95 = stats.percentile(0.95) if stats.samples >= self.min_samples else None
+            return (stats.error_rate > self.max_error_rate, p95 if p95 is not None else float("inf"), index)
+        return [candidate for _, candidate in sorted(enumerate(candidates), key=rank)]
+
+    def deadline(self, config_value):
+        """Seconds to wait on a model before hedging: its p95 once measured, else the default"""
+        stats = self.stats_for(model_key(config_value))
+        if stats.samples < self.min_samples:
+            return self.default_deadline
+        return max(self.min_deadline, stats.percentile(0.95))
+
+    def _record(self, config_value, tracker, elapsed, success):
+        # Prefer the duration the tracker reported to LaunchDarkly for this call. success is None
+        # for a cancelled call, whose time is only a lower bound: kept as latency, not as an outcome
+        summary = tracker.get_summary() if tracker is not None else None
+        if summary is not None and summary.duration is not None:
+            elapsed = summary.duration / 1000
+        model = model_key(config_value)
+        self.stats_for(model).record(elapsed, success)
+        metrics.llm_seconds.observe(elapsed, model, {True: "ok", False: "error"}.get(success, "cancelled"))
+
+    def _timed(self, request, config_value, tracker, cancel):
+        start = time.perf_counter()
+        result = None
+        try:
+            result = request(config_value, tracker, cancel)
+            return result
+        finally:
+            success = None if cancel.is_set() else (result is not None and "error" not in result)
+            self._record(config_value, tracker, time.perf_counter() - start, success)
+
+    def _submit(self, request, candidate, cancel):
+        if self._executor is None:
+            with self.lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="llm-hedge")
+        return self._executor.submit(contextvars.copy_context().run, self._timed, request, *candidate, cancel)
+
+    def call(self, candidates, request):
+        """Run request(config_value, tracker, cancel) on the best candidate, hedging once to the next.
+
+        A result without an "error" key wins; the loser's cancel event is set so a streamed
+        completion stops at its next chunk, while a non-streamed one finishes in the background
+        and is still reported. Returns the first success, or the last error result.
+        """
+        candidates = self.order(candidates)
+        if len(candidates) == 1:
+            return self._timed(request, *candidates[0], threading.Event())
+
+        cancels = {}
+        pending = set()
+        def launch(candidate):
+            cancel = threading.Event()
+            future = self._submit(request, candidate, cancel)
+            cancels[future] = cancel
+            pending.add(future)
+            return future
+
+        primary = launch(candidates[0])
+        alternates = candidates[1:]
+        done, _ = wait(pending, timeout=self.deadline(candidates[0][0]))
+        result = None
+        while True:
+            for future in done:
+                pending.discard(future)
+                result = future.result()
+                if result is not None and "error" not in result:
+                    for other in pending:
+                        cancels[other].set()
+                    metrics.llm_hedges.inc("primary" if future is primary else "alternate")
+                    return result
+            if not pending and not alternates:
+                return result
+            if alternates:
+                # The primary is past its deadline or failed; race the next model against it
+                launch(alternates.pop(0))
+                metrics.llm_hedges.inc("launched")
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+    async def _timed_async(self, request, config_value, tracker):
+        start = time.perf_counter()
+        result = None
+        success = None
+        try:
+            result = await request(config_value, tracker)
+            success = result is not None and "error" not in result
+            return result
+        finally:
+            self._record(config_value, tracker, time.perf_counter() - start, success)
+
+    async def call_async(self, candidates, request):
+        """call for coroutine requests, request(config_value, tracker); the loser's task is cancelled"""
+        candidates = self.order(candidates)
+        if len(candidates) == 1:
+            return await self._timed_async(request, *candidates[0])
+
+        primary = asyncio.create_task(self._timed_async(request, *candidates[0]))
+        pending = {primary}
+        alternates = candidates[1:]
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.deadline(candidates[0][0]))
+            result = None
+            while True:
+                for task in done:
+                    result = task.result()
+                    if result is not None and "error" not in result:
+                        metrics.llm_hedges.inc("primary" if task is primary else "alternate")
+                        return result
+                if not pending and not alternates:
+                    return result
+                if alternates:
+                    pending.add(asyncio.create_task(self._timed_async(request, *alternates.pop(0))))
+                    metrics.llm_hedges.inc("launched")
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Cancelling closes the loser's HTTP stream; it reports nothing to LaunchDarkly
+            for task in pending:
+                task.cancel()
+
+    def summary(self):
+        """{model: rolling latency and error stats}"""
+        with self.lock:
+            models = list(self.stats.items())
+        return {model: stats.summary() for model, stats in models}
@@ -1,193 +1,340 @@
 from datetime import datetime
-from notion_client import Client
+import asyncio
 import os
-from tabelog_scraper import scrape_tabelog
+import threading
+import time
+import metrics
+from change_feed import ARCHIVE, UPSERT, Change, ChangeFeed, webhook_action
+from entry_model import decode_page, encode_properties
+from entry_store import EntryStore
+from tabelog_scraper import scrape_tabelog, scrape_tabelog_async
+
+# Sort keys accepted by query_entries, mapped to the Notion property they order by
+SORT_PROPERTIES = {
+    "date": "Date",
+    "rating": "Rating",
+}
 
 class NotionService:
-    def __init__(self, notion_token=None):
-        self.notion = Client(auth=notion_token or os.getenv("NOTION_TOKEN"))
+    def __init__(self, notion_token=None, store=None, changes=None):
+        self._notion_token = notion_token
+        self._notion = None
+        self._notion_lock = threading.Lock()
         self.database_id = os.getenv("NOTION_DATABASE_ID")
+        # An empty ENTRY_STORE_PATH disables the local store and reads go straight to Notion
+        store_path = os.getenv("ENTRY_STORE_PATH", "entries.db")
+        self.store = store if store is not None else (EntryStore(store_path) if store_path else None)
+        self.sync_interval = float(os.getenv("NOTION_SYNC_INTERVAL", "30"))
+        self._last_sync = float("-inf")
+        self._sync_lock = threading.Lock()
+        # Upserts and archives seen by syncs, writes and webhooks, for anything derived from the store
+        self.changes = changes if changes is not None else ChangeFeed()
+
+    @property
+    def notion(self):
+        """The Notion API client, created on first use so importing routes doesn't open an HTTP pool"""
+        if self._notion is None:
+            with self._notion_lock:
+                if self._notion is None:
+                    self._notion = self._create_client()
+        return self._notion
+
+    @notion.setter
+    def notion(self, client):
+        self._notion = client
+
+    def _create_client(self):
+        from notion_client import Client
+        return Client(**self._client_options(self._notion_token))
+
+    def _client_options(self, notion_token):
+        options = {"auth": notion_token or os.getenv("NOTION_TOKEN")}
+        # NOTION_BASE_URL points the client at a stand-in API, e.g. the benchmark's fake server
+        if os.getenv("NOTION_BASE_URL"):
+            options["base_url"] = os.getenv("NOTION_BASE_URL")
+        return options
 
     def validate_url(self, url):
         """Validate URL format"""
         return "tabelog.com" in url or "s.tabelog.com" in url
 
-    def create_entry(self, link_url, notes, latitude=None, longitude=None, ai_model_info=None):
-        """Create a new entry in Notion with Tabelog data"""
+    def create_entry(self, link_url, notes, latitude=None, longitude=None, ai_model_info=None, tabelog_data=None):
+        """Create a new entry in Notion with Tabelog data, scraping it unless already provided"""
         try:
             if not self.database_id:
                 return False, "Database ID not configured"
             
-            tabelog_data = None
-            if self.validate_url(link_url):
+            if tabelog_data is None and self.validate_url(link_url):
             # if "tabelog.com" in link_url:
                 tabelog_data = scrape_tabelog(link_url)
             
-            # Prepare properties for Notion
-            properties = {
-                "Link": {"url": link_url},
-                "Notes": {
-                    "rich_text": [{
-                        "type": "text",
-                        "text": {"content": notes}
-                    }]
-                },
-                "Date": {
-                    "date": {"start": datetime.now().isoformat()}
-                }
-            }
-
-            if latitude and longitude:
-                properties.update({
-                    "Latitude": {"number": latitude},
-                    "Longitude": {"number": longitude}
-                })
-            
-            # Add Tabelog data properties if available
-            if tabelog_data:
-                if tabelog_data.get("name"):
-                    properties["Name"] = {
-                        "title": [{
-                            "type": "text",
-                            "text": {"content": tabelog_data["name"]}
-                        }]
-                    }
-                
-                if tabelog_data.get("rating"):
-                    properties["Rating"] = {"number": tabelog_data["rating"]}
-                
-                if tabelog_data.get("categories"):
-                    properties["Category"] = {
-                        "rich_text": [{
-                            "type": "text",
-                            "text": {"content": ", ".join(tabelog_data["categories"])}
-                        }]
-                    }
-                
-                if tabelog_data.get("address"):
-                    properties["Address"] = {
-                        "rich_text": [{
-                            "type": "text",
-                            "text": {"content": tabelog_data["address"]}
-                        }]
-                    }
-
-            if ai_model_info:
-                properties["AI_Model"] = {
-                    "rich_text": [{
-                        "type": "text",
-                        "text": {"content": ai_model_info["provider"]}
-                    }]
-                }
-
             # Create page in Notion
-            self.notion.pages.create(
-                parent={"database_id": self.database_id},
-                properties=properties
-            )
+            with metrics.span("notion.create"):
+                page = self.notion.pages.create(
+                    **self._create_request(link_url, notes, latitude, longitude, ai_model_info, tabelog_data)
+                )
+            self._saved(page)
             
             return True, "Entry saved successfully!"
         
         except Exception as e:
             return False, f"Error saving entry: {str(e)}"
 
+    def update_entry(self, entry_id, **fields):
+        """Write only the given Entry fields (e.g. rating=3.6) back to an entry's Notion page"""
+        try:
+            with metrics.span("notion.update"):
+                page = self.notion.pages.update(entry_id, properties=encode_properties(**fields))
+            self._saved(page)
+            return True, "Entry updated successfully!"
+        except Exception as e:
+            return False, f"Error updating entry: {str(e)}"
+
+    def _create_request(self, link_url, notes, latitude, longitude, ai_model_info, tabelog_data):
+        """pages.create arguments for a new entry"""
+        tabelog_data = tabelog_data or {}
+        has_coordinates = bool(latitude and longitude)
+        return {"parent": {"database_id": self.database_id}, "properties": encode_properties(
+            url=link_url,
+            content=notes,
+            date=datetime.now().isoformat(),
+            latitude=latitude if has_coordinates else None,
+            longitude=longitude if has_coordinates else None,
+            name=tabelog_data.get("name"),
+            rating=tabelog_data.get("rating"),
+            categories=tabelog_data.get("categories"),
+            address=tabelog_data.get("address"),
+            ai_model_info=ai_model_info["provider"] if ai_model_info else None
+        )}
+
+    def _saved(self, page):
+        """Write a created or updated page through so the change shows up without another query"""
+        entry = decode_page(page)
+        if self.store is not None:
+            self.store.upsert(entry, page.get("last_edited_time"))
+        self._publish([Change(UPSERT, entry.id, entry)])
+
+    def _publish(self, changes):
+        self.changes.publish(changes, self.store.version if self.store is not None else None)
+
+    def _archived(self, entry_ids):
+        """Drop entries from the store and publish their archives"""
+        removed = [entry_id for entry_id in entry_ids if self.store is None or self.store.delete(entry_id)]
+        self._publish([Change(ARCHIVE, entry_id) for entry_id in removed])
+
+    def _in_database(self, page):
+        parent = (page.get("parent") or {}).get("database_id") or ""
+        return parent.replace("-", "") == self.database_id.replace("-", "")
+
+    def _apply_page(self, page):
+        """Upsert a page re-read after a webhook, or archive it if it was trashed or moved away"""
+        if page.get("archived") or page.get("in_trash") or not self._in_database(page):
+            self._archived([page["id"]])
+        else:
+            self._apply_sync_pages([page])
+
     def get_entries(self):
-        """Get entries from Notion database with Tabelog data"""
+        """Get all entries as a list of Entry objects"""
+        return list(self.iter_entries())
+
+    def iter_entries(self, limit=None, page_size=100):
+        """Yield entries newest first, fetching pages lazily and stopping after limit"""
+        if not self.database_id:
+            return
+
+        if self.store is None:
+            yield from self._iter_remote_entries(limit, page_size)
+            return
+
+        self._refresh_store()
+        yield from self.store.iter_entries(limit=limit, batch_size=page_size)
+
+    def _store_query(self, limit, cursor, sort, order, category, min_rating):
+        return self.store.query(
+            limit=limit, cursor=cursor, sort=sort, order=order,
+            category=category, min_rating=min_rating
+        )
+
+    def query_entries(self, limit=50, cursor=None, sort="date", order="desc", category=None, min_rating=None):
+        """Get one page of entries plus the next page cursor, filtered and sorted by the backend"""
+        if not self.database_id:
+            return [], None
+
+        if self.store is not None:
+            self._refresh_store()
+            return self._store_query(limit, cursor, sort, order, category, min_rating)
+
         try:
-            if not self.database_id:
-                return []
-            
-            response = self.notion.databases.query(database_id=self.database_id)
-            
-            entries = []
-            for page in response.get("results", []):
-                entry = {
-                    "id": page["id"],
-                    "title": "",
-                    "url": "",  # Tabelog URL
-                    "notion_url": page["url"],  # Notion page URL
-                    "content": "",
-                    "created_time": page.get("created_time", ""),
-                    "tabelog_data": {}
-                }
-                
-                properties = page.get("properties", {})
-                
-                # Extract Link property (URL)
-                if "Link" in properties:
-                    link_prop = properties["Link"]
-                    if link_prop["type"] == "url" and link_prop["url"]:
-                        entry["title"] = link_prop["url"]
-                        entry["url"] = link_prop["url"]
-                
-                # Extract Notes property (rich_text)
-                if "Notes" in properties:
-                    notes_prop = properties["Notes"]
-                    if notes_prop["type"] == "rich_text" and notes_prop["rich_text"]:
-                        entry["content"] = notes_prop["rich_text"][0]["plain_text"]
-                
-                # Extract Date property (date type)
-                if "Date" in properties:
-                    date_prop = properties["Date"]
-                    if date_prop["type"] == "date" and date_prop["date"]:
-                        entry["date"] = date_prop["date"]["start"]
-                
-                # Extract Tabelog data
-                tabelog_data = {}
-                
-                # Restaurant Name (title type)
-                if "Name" in properties:
-                    name_prop = properties["Name"]
-                    if name_prop["type"] == "title" and name_prop["title"]:
-                        tabelog_data["name"] = name_prop["title"][0]["plain_text"]
-                
-                # Rating
-                if "Rating" in properties:
-                    rating_prop = properties["Rating"]
-                    if rating_prop["type"] == "number" and rating_prop["number"] is not None:
-                        tabelog_data["rating"] = rating_prop["number"]
-                
-                # Categories (rich_text type)
-                if "Category" in properties:
-                    category_prop = properties["Category"]
-                    if category_prop["type"] == "rich_text" and category_prop["rich_text"]:
-                        categories_text = category_prop["rich_text"][0]["plain_text"]
-                        tabelog_data["categories"] = [cat.strip() for cat in categories_text.split(",")]
-                
-                # Address
-                if "Address" in properties:
-                    address_prop = properties["Address"]
-                    if address_prop["type"] == "rich_text" and address_prop["rich_text"]:
-                        tabelog_data["address"] = address_prop["rich_text"][0]["plain_text"]
-                
-                if "Latitude" in properties:
-                    latitude_prop = properties["Latitude"]
-                    if latitude_prop["type"] == "number" and latitude_prop["number"] is not None:
-                        entry["latitude"] = latitude_prop["number"]
-                
-                if "Longitude" in properties:
-                    longitude_prop = properties["Longitude"]
-                    if longitude_prop["type"] == "number" and longitude_prop["number"] is not None:
-                        entry["longitude"] = longitude_prop["number"]
-                
-                if "AI_Model" in properties:
-                    ai_model_prop = properties["AI_Model"]
-                    if ai_model_prop["type"] == "rich_text" and ai_model_prop["rich_text"]:
-                        entry["ai_model_info"] = ai_model_prop["rich_text"][0]["plain_text"]
-                
-                entry["tabelog_data"] = tabelog_data
-                entries.append(entry)
-            
-            return entries
-        
+            with metrics.span("notion.query"):
+                response = self.notion.databases.query(**self._remote_query(limit, cursor, sort, order, category, min_rating))
+        except Exception as e:
+            print(f"Error querying entries: {e}")
+            return [], None
+        return self._query_result(response)
+
+    def _remote_query(self, limit, cursor, sort, order, category, min_rating):
+        """Notion database query for one page of filtered, sorted entries"""
+        query = {
+            "database_id": self.database_id,
+            "page_size": min(limit, 100),
+            "sorts": [{
+                "property": SORT_PROPERTIES[sort],
+                "direction": "descending" if order == "desc" else "ascending"
+            }]
+        }
+        filters = []
+        if category:
+            filters.append({"property": "Category", "rich_text": {"contains": category}})
+        if min_rating is not None:
+            filters.append({"property": "Rating", "number": {"greater_than_or_equal_to": min_rating}})
+        if filters:
+            query["filter"] = filters[0] if len(filters) == 1 else {"and": filters}
+        if cursor:
+            query["start_cursor"] = cursor
+        return query
+
+    def _query_result(self, response):
+        entries = [decode_page(page) for page in response.get("results", [])]
+        return entries, response.get("next_cursor") if response.get("has_more") else None
+
+    def data_version(self):
+        """Sync the local store and return a value that changes whenever entries do (None without a store)"""
+        if self.store is None or not self.database_id:
+            return None
+        self._refresh_store()
+        return self.store.version
+
+    def _refresh_store(self):
+        """Sync the local store, keeping the last synced copy if Notion is unreachable"""
+        if self.changes.polling:
+            return
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"Error syncing entries: {e}")
+
+    def _iter_pages(self, page_size=100, **query):
+        """Yield raw pages from a database query, following next_cursor until exhausted"""
+        query = self._pages_query(page_size, query)
+        while True:
+            with metrics.span("notion.query"):
+                response = self.notion.databases.query(**query)
+            yield from response.get("results", [])
+            if not self._advance(query, response):
+                return
+
+    def _pages_query(self, page_size, query):
+        return dict(query, database_id=self.database_id, page_size=min(page_size, 100))
+
+    def _advance(self, query, response):
+        """Point query at the next page of results, returning False after the last one"""
+        if not response.get("has_more") or not response.get("next_cursor"):
+            return False
+        query["start_cursor"] = response["next_cursor"]
+        return True
+
+    def _iter_remote_entries(self, limit=None, page_size=100):
+        """Yield entries straight from Notion when no local store is configured"""
+        try:
+            pages = self._iter_pages(**self._remote_entries_query(limit, page_size))
+            for count, page in enumerate(pages):
+                if limit is not None and count >= limit:
+                    return
+                yield decode_page(page)
+
         except Exception as e:
             print(f"Error getting entries: {e}")
-            return []
+
+    def _remote_entries_query(self, limit, page_size):
+        if limit is not None:
+            # Don't ask Notion for more rows than the caller will read
+            page_size = min(page_size, limit)
+        return {"page_size": page_size, "sorts": [{"timestamp": "created_time", "direction": "descending"}]}
+
+    def sync(self, force=False):
+        """Pull pages edited since the last sync into the local store"""
+        if self.store is None or not self.database_id:
+            return 0
+
+        with self._sync_lock:
+            if not self._sync_due(force):
+                return 0
+            with metrics.span("notion.sync"):
+                pages = list(self._iter_pages(**self._sync_query()))
+            return self._apply_sync(pages)
+
+    def _sync_due(self, force):
+        """Whether a sync should run now; call with the sync lock held"""
+        if not force and time.monotonic() - self._last_sync < self.sync_interval:
+            return False
+        # Counted from the attempt, so a failing Notion is retried once per interval, not per request
+        self._last_sync = time.monotonic()
+        return True
+
+    def _sync_query(self):
+        """Query for pages edited since the stored sync cursor, oldest first"""
+        cursor = self.store.get_cursor()
+        query = {"sorts": [{"timestamp": "last_edited_time", "direction": "ascending"}]}
+        if cursor:
+            # Notion rounds last_edited_time to the minute, so re-read the boundary minute
+            query["filter"] = {
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": cursor}
+            }
+        return query
+
+    def _apply_sync(self, pages):
+        """Upsert synced pages into the store and advance the cursor"""
+        changed = self._apply_sync_pages(pages)
+        latest = max((page.get("last_edited_time") or "" for page in pages), default=None)
+        if latest:
+            self.store.set_cursor(latest)
+        return len(changed)
+
+    def _apply_sync_pages(self, pages):
+        changed = self.store.upsert_many([(decode_page(page), page.get("last_edited_time")) for page in pages])
+        self._publish([Change(UPSERT, entry.id, entry) for entry in changed])
+        return changed
+
+    def reconcile(self):
+        """Archive stored entries whose pages were deleted or moved out of the database in Notion"""
+        if self.store is None or not self.database_id:
+            return 0
+        # IDs stored before the scan; entries created during it must not look deleted
+        stored = self.store.ids()
+        with metrics.span("notion.reconcile"):
+            # Only the title property, since just the page IDs are needed
+            live = {page["id"] for page in self._iter_pages(filter_properties=["title"])}
+        missing = stored - live
+        self._archived(missing)
+        return len(missing)
+
+    def apply_webhook_event(self, event):
+        """Apply a Notion webhook event to the store, re-reading the page it refers to"""
+        page_id = self._webhook_page_id(event)
+        if page_id is None:
+            return
+        with metrics.span("notion.retrieve"):
+            page = self.notion.pages.retrieve(page_id)
+        self._apply_page(page)
+
+    def _webhook_page_id(self, event):
+        """The page a webhook event asks to re-read, or None once it is applied (or ignored) without one"""
+        action = webhook_action(event)
+        if action is None or self.store is None or not self.database_id:
+            return None
+        kind, page_id = action
+        if kind == ARCHIVE:
+            self._archived([page_id])
+            return None
+        return page_id
 
     def delete_entry(self, entry_id):
         """Delete an entry by archiving it"""
         try:
-            self.notion.pages.update(entry_id, archived=True)
+            with metrics.span("notion.archive"):
+                self.notion.pages.update(entry_id, archived=True)
+            self._archived([entry_id])
             return True, "Entry deleted successfully!"
         except Exception as e:
             return False, f"Error deleting entry: {str(e)}"
@@ -198,22 +345,184 @@ class NotionService:
             if not self.database_id:
                 return None, "Database ID not configured"
             
-            database = self.notion.databases.retrieve(self.database_id)
-            properties = database.get("properties", {})
+            with metrics.span("notion.retrieve"):
+                database = self.notion.databases.retrieve(self.database_id)
+            return self._database_info(database), None
             
-            property_info = {
-                prop_name: {
-                    "type": prop_value["type"],
-                    "id": prop_value.get("id", "N/A")
-                }
-                for prop_name, prop_value in properties.items()
+        except Exception as e:
+            return None, str(e)
+
+    def _database_info(self, database):
+        properties = database.get("properties", {})
+        
+        property_info = {
+            prop_name: {
+                "type": prop_value["type"],
+                "id": prop_value.get("id", "N/A")
             }
-            
-            return {
-                "database_id": self.database_id,
-                "database_title": database.get("title", []),
-                "properties": property_info
-            }, None
-            
+            for prop_name, prop_value in properties.items()
+        }
+        
+        return {
+            "database_id": self.database_id,
+            "database_title": database.get("title", []),
+            "properties": property_info
+        }
+
+class AsyncNotionService(NotionService):
+    """NotionService over notion_client.AsyncClient for the ASGI app; methods that reach Notion are coroutines"""
+
+    def __init__(self, notion_token=None, store=None, changes=None):
+        super().__init__(notion_token, store, changes)
+        self._sync_lock = asyncio.Lock()
+
+    def _create_client(self):
+        from notion_client import AsyncClient
+        return AsyncClient(**self._client_options(self._notion_token))
+
+    async def create_entry(self, link_url, notes, latitude=None, longitude=None, ai_model_info=None, tabelog_data=None):
+        """Create a new entry in Notion with Tabelog data, scraping it unless already provided"""
+        try:
+            if not self.database_id:
+                return False, "Database ID not configured"
+
+            if tabelog_data is None and self.validate_url(link_url):
+                tabelog_data = await scrape_tabelog_async(link_url)
+
+            with metrics.span("notion.create"):
+                page = await self.notion.pages.create(
+                    **self._create_request(link_url, notes, latitude, longitude, ai_model_info, tabelog_data)
+                )
+            self._saved(page)
+            return True, "Entry saved successfully!"
+
+        except Exception as e:
+            return False, f"Error saving entry: {str(e)}"
+
+    async def update_entry(self, entry_id, **fields):
+        """Write only the given Entry fields (e.g. rating=3.6) back to an entry's Notion page"""
+        try:
+            with metrics.span("notion.update"):
+                page = await self.notion.pages.update(entry_id, properties=encode_properties(**fields))
+            self._saved(page)
+            return True, "Entry updated successfully!"
+        except Exception as e:
+            return False, f"Error updating entry: {str(e)}"
+
+    async def get_entries(self):
+        """Get all entries as a list of Entry objects"""
+        return [entry async for entry in self.iter_entries()]
+
+    async def iter_entries(self, limit=None, page_size=100):
+        """Yield entries newest first, fetching pages lazily and stopping after limit"""
+        if not self.database_id:
+            return
+
+        if self.store is None:
+            async for entry in self._iter_remote_entries(limit, page_size):
+                yield entry
+            return
+
+        await self._refresh_store()
+        for entry in self.store.iter_entries(limit=limit, batch_size=page_size):
+            yield entry
+
+    async def query_entries(self, limit=50, cursor=None, sort="date", order="desc", category=None, min_rating=None):
+        """Get one page of entries plus the next page cursor, filtered and sorted by the backend"""
+        if not self.database_id:
+            return [], None
+
+        if self.store is not None:
+            await self._refresh_store()
+            return self._store_query(limit, cursor, sort, order, category, min_rating)
+
+        try:
+            with metrics.span("notion.query"):
+                response = await self.notion.databases.query(**self._remote_query(limit, cursor, sort, order, category, min_rating))
+        except Exception as e:
+            print(f"Error querying entries: {e}")
+            return [], None
+        return self._query_result(response)
+
+    async def data_version(self):
+        """Sync the local store and return a value that changes whenever entries do (None without a store)"""
+        if self.store is None or not self.database_id:
+            return None
+        await self._refresh_store()
+        return self.store.version
+
+    async def _refresh_store(self):
+        """Sync the local store, keeping the last synced copy if Notion is unreachable"""
+        if self.changes.polling:
+            return
+        try:
+            await self.sync()
+        except Exception as e:
+            print(f"Error syncing entries: {e}")
+
+    async def _iter_pages(self, page_size=100, **query):
+        """Yield raw pages from a database query, following next_cursor until exhausted"""
+        query = self._pages_query(page_size, query)
+        while True:
+            with metrics.span("notion.query"):
+                response = await self.notion.databases.query(**query)
+            for page in response.get("results", []):
+                yield page
+            if not self._advance(query, response):
+                return
+
+    async def _iter_remote_entries(self, limit=None, page_size=100):
+        """Yield entries straight from Notion when no local store is configured"""
+        try:
+            count = 0
+            async for page in self._iter_pages(**self._remote_entries_query(limit, page_size)):
+                if limit is not None and count >= limit:
+                    return
+                count += 1
+                yield decode_page(page)
+
+        except Exception as e:
+            print(f"Error getting entries: {e}")
+
+    async def sync(self, force=False):
+        """Pull pages edited since the last sync into the local store"""
+        if self.store is None or not self.database_id:
+            return 0
+
+        # Requests that arrive during a sync wait for it rather than starting another
+        async with self._sync_lock:
+            if not self._sync_due(force):
+                return 0
+            with metrics.span("notion.sync"):
+                pages = [page async for page in self._iter_pages(**self._sync_query())]
+            return self._apply_sync(pages)
+
+    async def delete_entry(self, entry_id):
+        """Delete an entry by archiving it"""
+        try:
+            with metrics.span("notion.archive"):
+                await self.notion.pages.update(entry_id, archived=True)
+            self._archived([entry_id])
+            return True, "Entry deleted successfully!"
+        except Exception as e:
+            return False, f"Error deleting entry: {str(e)}"
+
+    async def apply_webhook_event(self, event):
+        """Apply a Notion webhook event to the store, re-reading the page it refers to"""
+        page_id = self._webhook_page_id(event)
+        if page_id is None:
+            return
+        with metrics.span("notion.retrieve"):
+            page = await self.notion.pages.retrieve(page_id)
+        self._apply_page(page)
+
+    async def get_database_info(self):
+        """Get database properties for debugging"""
+        try:
+            if not self.database_id:
+                return None, "Database ID not configured"
+            with metrics.span("notion.retrieve"):
+                return self._database_info(await self.notion.databases.retrieve(self.database_id)), None
         except Exception as e:
             return None, str(e)
+
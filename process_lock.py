@@ -0,0 +1,45 @@
+import fcntl
+import threading
+import time
+
+class ProcessLock:
+    """Exclusive lock on a file that picks one process per host, e.g. one of several gunicorn workers.
+
+    The lock is held until the process exits, when the OS releases it for another process to take.
+    """
+
+    def __init__(self, path, retry_interval=30):
+        self.path = path
+        self.retry_interval = retry_interval
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def held(self):
+        return self._file is not None
+
+    def acquire(self):
+        """Take the lock without blocking, returning whether this process holds it"""
+        with self._lock:
+            if self._file is not None:
+                return True
+            f = open(self.path, "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            self._file = f
+            return True
+
+    def run_when_acquired(self, callback, name="process-lock"):
+        """Call callback now if the lock is free, else from a thread once the holding process exits"""
+        if self.acquire():
+            callback()
+            return
+
+        def wait():
+            while not self.acquire():
+                time.sleep(self.retry_interval)
+            callback()
+        threading.Thread(target=wait, name=name, daemon=True).start()
@@ -0,0 +1,50 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+# Notion asks integrations to average about three requests per second
+NOTION_REQUESTS_PER_SECOND = 3
+
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` calls per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class HostRateLimiter:
+    """One TokenBucket per URL host, plus a random pause so requests don't land on a fixed beat"""
+
+    def __init__(self, rate, jitter=0.0):
+        self.rate = rate
+        self.jitter = jitter  # maximum extra seconds slept after each token
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """Block until a request to url's host is allowed"""
+        host = urlparse(url).hostname
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, capacity=1)
+        bucket.acquire()
+        if self.jitter:
+            time.sleep(random.uniform(0, self.jitter))
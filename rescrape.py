@@ -0,0 +1,154 @@
+import argparse
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from notion_service import NotionService
+from rate_limit import NOTION_REQUESTS_PER_SECOND, HostRateLimiter, TokenBucket
+from tabelog_scraper import fetch_page, parse_tabelog, snapshots
+
+# Entry fields that drift on Tabelog. Names and categories are only scraped when an entry is created,
+# since they are corrected by hand in Notion; notes, dates and coordinates belong to the diary
+REFRESHED_FIELDS = ("rating", "address")
+
+def changed_fields(entry, tabelog_data):
+    """Tabelog fields that differ from the entry, ignoring ones the page no longer yields"""
+    changed = {}
+    for field in REFRESHED_FIELDS:
+        value = tabelog_data.get(field)
+        if value is not None and value != getattr(entry, field):
+            changed[field] = value
+    return changed
+
+def entries_by_url(notion_service):
+    """{Tabelog URL: [entries]}; a restaurant can be in the diary more than once"""
+    by_url = {}
+    for entry in notion_service.iter_entries():
+        if entry.url and notion_service.validate_url(entry.url):
+            by_url.setdefault(entry.url, []).append(entry)
+    return by_url
+
+def push_changes(notion_service, entries, tabelog_data, limiter):
+    """Update each entry's changed fields in Notion, returning how many entries were updated"""
+    updated = 0
+    for entry in entries:
+        fields = changed_fields(entry, tabelog_data)
+        if not fields:
+            continue
+        limiter.acquire()
+        success, message = notion_service.update_entry(entry.id, **fields)
+        if success:
+            updated += 1
+        else:
+            print(f"Error updating {entry.url}: {message}")
+    return updated
+
+class RescrapeScheduler:
+    """Background thread that re-fetches Tabelog pages older than max_age and pushes changed fields to Notion"""
+
+    def __init__(self, notion_service, max_age=7 * 24 * 3600, interval=600, host_rate=0.1, jitter=5.0, batch_size=50):
+        self.notion_service = notion_service
+        self.max_age = max_age
+        self.interval = interval  # seconds between passes; 0 disables the thread
+        self.batch_size = batch_size  # pages refreshed per pass at most; None for all
+        self.host_limiter = HostRateLimiter(host_rate, jitter)
+        self.notion_limiter = TokenBucket(NOTION_REQUESTS_PER_SECOND, capacity=1)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the scheduler thread once; needs the snapshot store to know when pages were fetched"""
+        if self._thread is not None or self.interval <= 0 or snapshots is None:
+            return
+        self._thread = threading.Thread(target=self._run, name="tabelog-rescrape", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def due(self):
+        """(url, entries) for pages last fetched more than max_age ago or never, stalest first"""
+        fetched = snapshots.fetched_at()
+        cutoff = time.time() - self.max_age
+        stale = [(fetched.get(url, 0), url, entries) for url, entries in entries_by_url(self.notion_service).items()
+                 if fetched.get(url, 0) < cutoff]
+        stale.sort(key=lambda item: item[0])
+        return [(url, entries) for _, url, entries in stale]
+
+    def refresh(self, url, entries):
+        """Re-fetch one page, revalidating the cached copy, and push changed fields"""
+        self.host_limiter.acquire(url)
+        tabelog_data = parse_tabelog(fetch_page(url, max_age=0))
+        return push_changes(self.notion_service, entries, tabelog_data, self.notion_limiter)
+
+    def run_once(self):
+        """Refresh up to batch_size stale pages, returning how many entries changed"""
+        updated = 0
+        for url, entries in self.due()[:self.batch_size]:
+            if self._stop.is_set():
+                break
+            try:
+                updated += self.refresh(url, entries)
+            except Exception as e:
+                print(f"Error refreshing {url}: {e}")
+        return updated
+
+    def _run(self):
+        # Wait a full interval first so a restart doesn't immediately crawl Tabelog
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+def _extract(body):
+    """Parse one compressed snapshot in a worker process"""
+    try:
+        return parse_tabelog(zlib.decompress(body).decode("utf-8"))
+    except Exception as e:
+        print(f"Error parsing snapshot: {e}")
+        return None
+
+def reextract(notion_service, workers=None, dry_run=False):
+    """Re-parse every entry's latest snapshot across a process pool and push only changed fields"""
+    by_url = entries_by_url(notion_service)
+    pages = [(url, body) for url, body in snapshots.iter_latest() if url in by_url]
+    limiter = TokenBucket(NOTION_REQUESTS_PER_SECOND, capacity=1)
+    result = {"snapshots": len(pages), "changed": 0, "updated": 0}
+    with ProcessPoolExecutor(workers) as pool:
+        parsed = pool.map(_extract, [body for _, body in pages], chunksize=8)
+        for (url, _), tabelog_data in zip(pages, parsed):
+            if tabelog_data is None:
+                continue
+            for entry in by_url[url]:
+                fields = changed_fields(entry, tabelog_data)
+                if fields:
+                    result["changed"] += 1
+                    if dry_run:
+                        print(f"{url}: {fields}")
+            if not dry_run:
+                result["updated"] += push_changes(notion_service, by_url[url], tabelog_data, limiter)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh diary entries from Tabelog or from stored page snapshots")
+    parser.add_argument("command", choices=("refresh", "reextract"),
+                        help="refresh: re-fetch stale pages now; reextract: re-parse stored snapshots without fetching")
+    parser.add_argument("--workers", type=int, help="reextract worker processes (default: CPU count)")
+    parser.add_argument("--max-age", type=float, default=7 * 24 * 3600, help="refresh pages fetched longer ago than this (seconds)")
+    parser.add_argument("--dry-run", action="store_true", help="reextract: print changes without writing to Notion")
+    args = parser.parse_args()
+
+    if snapshots is None:
+        parser.error("TABELOG_SNAPSHOT_PATH is empty, so there are no snapshots")
+
+    notion_service = NotionService()
+    if args.command == "reextract":
+        print(reextract(notion_service, workers=args.workers, dry_run=args.dry_run))
+    else:
+        scheduler = RescrapeScheduler(notion_service, max_age=args.max_age, batch_size=None)
+        print(f"{scheduler.run_once()} entries updated")
+
+if __name__ == "__main__":
+    main()
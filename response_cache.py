@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+import metrics
+
+class CachedResponse:
+    """A rendered response body with its validators"""
+    __slots__ = ("body", "mimetype", "etag", "last_modified")
+
+    def __init__(self, body, mimetype, etag, last_modified):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.last_modified = last_modified
+
+class ResponseCache:
+    """Rendered pages and JSON keyed by request path, valid until the entry data version changes"""
+
+    def __init__(self, max_entries=256, stale_while_revalidate=False, revalidate_interval=1.0):
+        self.max_entries = max_entries
+        # Serve cached responses without waiting on a Notion sync and check the version in the background
+        self.stale_while_revalidate = stale_while_revalidate
+        self.revalidate_interval = revalidate_interval
+        self.version = None  # data version the cached responses were rendered from
+        self.generation = 0  # bumped whenever cached responses are dropped
+        self.last_modified = time.time()
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
+        self._revalidating = False
+        self._revalidated_at = float("-inf")
+        self._task = None
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def invalidate(self):
+        """Drop every cached response, e.g. after an entry is added or deleted"""
+        with self.lock:
+            self._clear()
+
+    def _clear(self):
+        self.responses.clear()
+        self.generation += 1
+        self.last_modified = time.time()
+
+    def validate(self, version):
+        """Drop cached responses if the data version moved, returning the generation to cache under"""
+        with self.lock:
+            if version != self.version:
+                self.version = version
+                self._clear()
+            return self.generation
+
+    def get(self, key):
+        """The cached response for a request path, or None"""
+        with self.lock:
+            cached = self.responses.get(key)
+            if cached is not None:
+                self.responses.move_to_end(key)
+        metrics.cache_lookups.inc("response", "hit" if cached is not None else "miss")
+        return cached
+
+    def put(self, key, generation, body, mimetype):
+        """Cache a body rendered during `generation`; returns the entry, or None if it is already stale"""
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        with self.lock:
+            if generation != self.generation:
+                return None
+            cached = CachedResponse(body, mimetype, etag, self.last_modified)
+            self.responses[key] = cached
+            self.responses.move_to_end(key)
+            while len(self.responses) > self.max_entries:
+                self.responses.popitem(last=False)
+        return cached
+
+    def capture(self, key, generation, chunks, mimetype):
+        """Pass a streamed body through, caching it once the last chunk has been sent"""
+        body = []
+        for chunk in chunks:
+            body.append(chunk.encode() if isinstance(chunk, str) else chunk)
+            yield chunk
+        self.put(key, generation, b"".join(body), mimetype)
+
+    def headers(self, cached):
+        """Validators for a cached response; no-cache makes browsers revalidate and get 304s"""
+        return {
+            "ETag": f'"{cached.etag}"',
+            "Last-Modified": formatdate(cached.last_modified, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+
+    def not_modified(self, cached, if_none_match, if_modified_since):
+        """Whether a request's conditional headers already match the cached response"""
+        if if_none_match:
+            return if_none_match.contains(cached.etag)
+        # HTTP dates have one-second resolution
+        return if_modified_since is not None and int(cached.last_modified) <= if_modified_since.timestamp()
+
+    def _claim_revalidation(self):
+        with self.lock:
+            if self._revalidating or time.monotonic() - self._revalidated_at < self.revalidate_interval:
+                return False
+            self._revalidating = True
+            return True
+
+    def _finish_revalidation(self, version):
+        self.validate(version)
+        with self.lock:
+            self._revalidating = False
+            self._revalidated_at = time.monotonic()
+
+    def revalidate(self, load_version):
+        """Re-read the data version on a background thread unless a check ran or is running recently"""
+        if self._claim_revalidation():
+            threading.Thread(target=self._revalidate, args=(load_version,), name="response-revalidate", daemon=True).start()
+
+    def _revalidate(self, load_version):
+        version = self.version
+        try:
+            version = load_version()
+        finally:
+            self._finish_revalidation(version)
+
+    def revalidate_async(self, load_version):
+        """revalidate for the async serving mode, taking a coroutine function"""
+        if self._claim_revalidation():
+            self._task = asyncio.create_task(self._revalidate_async(load_version))
+
+    async def _revalidate_async(self, load_version):
+        version = self.version
+        try:
+            version = await load_version()
+        finally:
+            self._finish_revalidation(version)
@@ -1,100 +1,587 @@
-from flask import render_template, request, jsonify, redirect, url_for, flash
+from flask import render_template, stream_template, request, jsonify, redirect, url_for, flash, get_flashed_messages, g, session
 from dotenv import load_dotenv
-import aiconfigs
 from notion_service import NotionService
+from ingest_queue import JobQueue, IngestWorkerPool, make_entry_handler
+from geocode_cache import GeocodeCache
+from bulk_import import BulkImporter, Checkpoint, read_rows
+from marker_index import CLUSTER_MAX_ZOOM, MarkerIndex
+from response_cache import ResponseCache
+from change_feed import ChangePoller, verify_signature
+from rescrape import RescrapeScheduler
+from static_export import ExportRebuilder, StaticExport
+from process_lock import ProcessLock
+import aiconfigs
+import math
+import metrics
 import os
+import threading
+import time
+import uuid
 
 notion_service = NotionService()
 load_dotenv()
 
+geocode_cache = GeocodeCache(
+    os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.db"),
+    ttl=float(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600))),
+    max_entries=int(os.getenv("GEOCODE_CACHE_SIZE", "10000"))
+)
+
+# Rendered index/map pages and marker JSON; RESPONSE_CACHE_SIZE=0 turns it off
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "256")),
+    stale_while_revalidate=os.getenv("RESPONSE_CACHE_SWR", "false").lower() in ("1", "true", "yes")
+)
+
+ingest_pool = IngestWorkerPool(
+    JobQueue(os.getenv("INGEST_QUEUE_PATH", "jobs.db")),
+    make_entry_handler(notion_service, geocode_cache),
+    workers=int(os.getenv("INGEST_WORKERS", "2"))
+)
+
+marker_index = MarkerIndex()
+
+# Keeps the store current from Notion edits; NOTION_POLL_INTERVAL=0 syncs on reads instead
+change_poller = ChangePoller(
+    notion_service,
+    interval=float(os.getenv("NOTION_POLL_INTERVAL", "10")),
+    reconcile_interval=float(os.getenv("NOTION_RECONCILE_INTERVAL", "3600"))
+)
+
+# Re-fetches stale Tabelog pages and pushes changed ratings/addresses; TABELOG_REFRESH_INTERVAL=0 (default) is off
+rescrape_scheduler = RescrapeScheduler(
+    notion_service,
+    max_age=float(os.getenv("TABELOG_REFRESH_AGE", str(7 * 24 * 3600))),
+    interval=float(os.getenv("TABELOG_REFRESH_INTERVAL", "0")),
+    host_rate=float(os.getenv("TABELOG_REFRESH_RPS", "0.1"))
+)
+
+@notion_service.changes.subscribe
+def _entries_changed(changes, version):
+    # Cached pages are all rendered from the same data, so any change drops them
+    response_cache.validate(version)
+    marker_index.apply(changes, version)
+
+metrics.Gauge("sweetski_ingest_jobs_queued", "Entry submissions waiting for a worker", ingest_pool.queue.queued)
+
+# SERVE_STATIC_EXPORT=true answers page, map and marker reads from precompressed files built from the store,
+# rebuilt when entries change; submissions and deletions are refused meanwhile
+SERVE_STATIC_EXPORT = os.getenv("SERVE_STATIC_EXPORT", "false").lower() in ("1", "true", "yes")
+static_export = StaticExport(os.getenv("STATIC_EXPORT_DIR", "export"), keep=int(os.getenv("STATIC_EXPORT_KEEP", "3")))
+export_rebuilder = ExportRebuilder(static_export, render=None, delay=float(os.getenv("STATIC_EXPORT_DELAY", "2")))
+if SERVE_STATIC_EXPORT:
+    notion_service.changes.subscribe(export_rebuilder.changed)
+
+READ_ONLY_ENDPOINTS = {'add_entry', 'delete_entry', 'bulk_import', 'resume_bulk_import'}
+
+MAP_CENTER = (34.92534863829663, 135.79543051024322)
+
+IMPORT_DIR = os.getenv("BULK_IMPORT_DIR", "imports")
+
+# Bulk imports started from the API in this process, by import ID
+bulk_imports = {}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+def _entry_query_args(args):
+    """Read pagination, sort and filter parameters shared by the index page and the entries API"""
+    sort = args.get('sort', 'date')
+    if sort not in ('date', 'rating'):
+        raise ValueError("sort must be 'date' or 'rating'")
+    order = args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+        min_rating = float(args['min_rating']) if args.get('min_rating') else None
+    except ValueError:
+        raise ValueError("limit and min_rating must be numbers")
+    if min_rating is not None and not math.isfinite(min_rating):
+        raise ValueError("min_rating must be a finite number")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    return {
+        'limit': limit,
+        'cursor': args.get('cursor') or None,
+        'sort': sort,
+        'order': order,
+        'category': args.get('category', '').strip() or None,
+        'min_rating': min_rating
+    }
+
+def _viewport_args(args):
+    """Read the bbox=south,west,north,east and zoom parameters of the markers API"""
+    try:
+        south, west, north, east = (float(value) for value in args.get('bbox', '').split(','))
+        zoom = int(args.get('zoom', ''))
+    except ValueError:
+        raise ValueError("bbox=south,west,north,east and an integer zoom are required")
+    if not all(math.isfinite(value) for value in (south, west, north, east)):
+        raise ValueError("bbox must be finite numbers")
+    if not 0 <= zoom <= 22 or south > north:
+        raise ValueError("zoom must be 0-22 and south <= north")
+    # Clamped to the world, so the grid cells a box spans stay bounded
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = min(max(west, -180.0), 180.0), min(max(east, -180.0), 180.0)
+    return south, west, north, east, zoom
+
+def _next_page_args(args, next_cursor):
+    """url_for arguments for the index page after this one, keeping the request's filters, or None on the last page"""
+    if not next_cursor:
+        return None
+    params = {key: value for key, value in args.items() if key != 'cursor'}
+    return dict(params, cursor=next_cursor)
+
+def _map_context():
+    """map.html's template context, or None when the Maps key isn't configured"""
+    api_key = os.getenv("GOOGLE_MAPS_API")
+    if not api_key:
+        return None
+    # Markers are fetched per viewport from /api/markers
+    return {'api_key': api_key, 'center_lat': MAP_CENTER[0], 'center_lng': MAP_CENTER[1]}
+
+def _markers_in(south, west, north, east, zoom):
+    if west > east:
+        # Viewport crosses the antimeridian; query both sides
+        return (marker_index.query(south, west, north, 180, zoom)
+                + marker_index.query(south, -180, north, east, zoom))
+    return marker_index.query(south, west, north, east, zoom)
+
+def _markers_payload(south, west, north, east, zoom):
+    return {"zoom": zoom, "markers": _markers_in(south, west, north, east, zoom)}
+
+def _entries_payload(entries, next_cursor):
+    return {"entries": [entry.to_dict() for entry in entries], "next_cursor": next_cursor}
+
+def _submission(form):
+    """The ingest job payload for a submitted entry form, or raise ValueError with the message to flash"""
+    link_url = form.get('link_url', '').strip()
+    notes = form.get('notes', '').strip()
+    if not link_url or not notes:
+        raise ValueError('Please fill in both link and notes!')
+    if not notion_service.validate_url(link_url):
+        raise ValueError('Please enter a valid Tabelog URL!')
+    return {"link_url": link_url, "notes": notes}
+
+def _submitted(job_id, status_url, accept_mimetypes):
+    """JSON response for an API submission, or None to flash this message and redirect"""
+    if accept_mimetypes.best == 'application/json':
+        return {"job_id": job_id, "status_url": status_url}, 202
+    return None
+
+def _received_message(job_id):
+    return f'Entry received (job {job_id})! It will appear in the diary in a few seconds.'
+
+def _job_status(queue, job_id):
+    job = queue.get(job_id)
+    if job is None:
+        return {"error": "Job not found"}, 404
+    return job
+
+def _bulk_import_upload(upload):
+    """(import ID, path to save the upload to), or raise ValueError for an unsupported file"""
+    if not upload or not upload.filename.endswith(('.csv', '.jsonl')):
+        raise ValueError("Upload a .csv or .jsonl file as 'file'")
+    import_id = uuid.uuid4().hex
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    return import_id, os.path.join(IMPORT_DIR, import_id + os.path.splitext(upload.filename)[1])
+
+def _bulk_import_status(import_id):
+    importer = bulk_imports.get(import_id)
+    if importer is None:
+        return {"error": "Import not found"}, 404
+    return importer.progress
+
+def _resume_bulk_import(import_id):
+    """Re-run an import, skipping rows its checkpoint already marks done"""
+    importer = bulk_imports.get(import_id)
+    if importer is not None and not importer.progress["finished"]:
+        return {"error": "Import is still running"}, 409
+    paths = [os.path.join(IMPORT_DIR, import_id + ext) for ext in ('.csv', '.jsonl')]
+    path = next((p for p in paths if os.path.exists(p)), None)
+    if path is None:
+        return {"error": "Import not found"}, 404
+    _start_bulk_import(import_id, path)
+    return {"import_id": import_id}, 202
+
+def _webhook_check(event, body, signature):
+    """The response for a handshake or a badly signed delivery, or None to apply the event"""
+    if 'verification_token' in event:
+        # Subscription handshake: paste this token into Notion and set NOTION_WEBHOOK_SECRET to it
+        print(f"Notion webhook verification token: {event['verification_token']}")
+        return {}, 200
+    if not verify_signature(os.getenv("NOTION_WEBHOOK_SECRET"), body, signature):
+        return {"error": "Invalid signature"}, 401
+    return None
+
+def _webhook_failed(e):
+    # A non-2xx response makes Notion retry the delivery
+    print(f"Error applying Notion webhook event: {e}")
+    return {"error": str(e)}, 500
+
+def _database_info_response(result, error):
+    if error:
+        return {"error": error}, 400 if "not configured" in error else 500
+    return result
+
+def _cacheable(session):
+    # Pending flashes are rendered into the page for one user only
+    return response_cache.enabled and not session.get('_flashes')
+
+def _cache_generation():
+    """Generation to cache this request's response under, or None when it must not be cached"""
+    if not _cacheable(session):
+        return None
+    if response_cache.stale_while_revalidate and response_cache.version is not None:
+        response_cache.revalidate(notion_service.data_version)
+        return response_cache.generation
+    version = notion_service.data_version()
+    # Without a local store Notion changes can't be detected, so nothing is cached
+    return response_cache.validate(version) if version is not None else None
+
+def _serve_cached(request, cached):
+    """(body, status, headers) for a cached response, answering 304 when the client's copy matches"""
+    headers = response_cache.headers(cached)
+    if response_cache.not_modified(cached, request.if_none_match, request.if_modified_since):
+        return '', 304, headers
+    headers['Content-Type'] = cached.mimetype
+    return cached.body, 200, headers
+
+def _cached(request, generation):
+    if generation is None:
+        return None
+    cached = response_cache.get(request.full_path)
+    return cached and _serve_cached(request, cached)
+
+def _cache_body(request, generation, body, mimetype):
+    """Cache a fully rendered body and serve it with validators"""
+    if generation is not None:
+        cached = response_cache.put(request.full_path, generation, body, mimetype)
+        if cached is not None:
+            return _serve_cached(request, cached)
+    return body, 200, {'Content-Type': mimetype}
+
+def _start_request_trace(g):
+    g.request_start = time.perf_counter()
+    g.spans = metrics.start_trace()
+
+def _record_request(request, g, response):
+    """Observe the route's latency and expose its spans in a Server-Timing header"""
+    if 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.request_seconds.observe(time.perf_counter() - g.request_start, request.method, route, response.status_code)
+        if g.spans:
+            response.headers['Server-Timing'] = metrics.server_timing(g.spans)
+    return response
+
+def _metrics_response():
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def _start_bulk_import(import_id, path):
+    importer = BulkImporter(notion_service, geocode_cache)
+    bulk_imports[import_id] = importer
+    checkpoint = Checkpoint(os.path.join(IMPORT_DIR, f"{import_id}.checkpoint.jsonl"))
+    threading.Thread(
+        target=importer.run, args=(read_rows(path), checkpoint),
+        name=f"bulk-import-{import_id}", daemon=True
+    ).start()
+
+# PID of the process the background threads run in; threads don't survive a fork, so each worker starts its own
+_services_pid = None
+_services_lock = threading.Lock()
+
+# The Notion poller, Tabelog scheduler and export rebuilder run in one process per host, so polling, crawl
+# rates and rate limits stay per host; other workers see their writes through the shared store's data version.
+# An empty SERVICES_LOCK_PATH runs them in every process.
+_host_lock_path = os.getenv("SERVICES_LOCK_PATH", "services.lock")
+host_services_lock = ProcessLock(_host_lock_path) if _host_lock_path else None
+
+def _start_host_services():
+    change_poller.start()
+    rescrape_scheduler.start()
+    if SERVE_STATIC_EXPORT:
+        export_rebuilder.start()
+
+def start_host_services():
+    """Start the host-wide services here if this process holds the lock, or once the holder exits"""
+    if host_services_lock is None:
+        _start_host_services()
+    else:
+        host_services_lock.run_when_acquired(_start_host_services, name="host-services-lock")
+
+def start_services():
+    """Start the ingest workers and connect LaunchDarkly once per process, and the host-wide services in one process"""
+    global _services_pid
+    if _services_pid == os.getpid():
+        return
+    with _services_lock:
+        if _services_pid == os.getpid():
+            return
+        ingest_pool.start()
+        start_host_services()
+        # Connect before serving, so the first submission doesn't wait on the SDK
+        try:
+            aiconfigs.init_ld_client()
+        except ValueError as e:
+            print(f"AI client not initialized yet: {e}")
+        _services_pid = os.getpid()
+
+def prewarm(app):
+    """Do first-request work at startup: heavy imports, template compilation, the Notion client and the marker index.
+
+    Done in a pre-fork master (gunicorn.conf.py) it is shared copy-on-write by every worker.
+    """
+    aiconfigs.preload()
+    for template in ('python_frontend.html', 'map.html'):
+        app.jinja_env.get_template(template)
+    notion_service.notion
+    store = notion_service.store
+    if store is not None:
+        # From the local copy only; the first request syncs with Notion as usual
+        marker_index.ensure_fresh(store.version, store.iter_entries)
+
+
+def export_files(app, changed_ids=None):
+    """(files, pages, reuse) for StaticExport.build: index pages, the map page, a clustered marker layer per zoom and each entry.
+
+    With changed_ids, the files of entries not in it are reused from the current export.
+    """
+    entries = notion_service.get_entries()
+    files = {}
+    pages = {}  # index cursor -> file, so the export serves the live pagination links
+    with app.test_request_context('/'):
+        cursor, page = None, 1
+        while True:
+            page_entries, next_cursor = notion_service.query_entries(limit=DEFAULT_PAGE_SIZE, cursor=cursor)
+            next_page = _next_page_args({}, next_cursor)
+            next_url = url_for('index', **next_page) if next_page else None
+            path = 'index.html' if page == 1 else f'index/{page}.html'
+            body = render_template('python_frontend.html', entries=page_entries, next_url=next_url)
+            files[path] = (body.encode(), 'text/html; charset=utf-8')
+            pages[cursor or ''] = path
+            if not next_cursor:
+                break
+            cursor, page = next_cursor, page + 1
+
+        map_context = _map_context()
+        if map_context:
+            files['map.html'] = (render_template('map.html', **map_context).encode(), 'text/html; charset=utf-8')
+
+        marker_index.ensure_fresh(notion_service.data_version(), notion_service.iter_entries)
+        # Clustered layers only; above CLUSTER_MAX_ZOOM every entry is its own marker, so those zooms stay viewport-bounded
+        for zoom in range(CLUSTER_MAX_ZOOM + 1):
+            response = jsonify(_markers_payload(-90, -180, 90, 180, zoom))
+            files[f'markers/{zoom}.json'] = (response.get_data(), response.content_type)
+
+        response = jsonify(_entries_payload(entries, None))
+        files['entries.json'] = (response.get_data(), response.content_type)
+
+        reuse = []
+        for entry in entries:
+            path = f'entries/{entry.id}.json'
+            if changed_ids is not None and entry.id not in changed_ids:
+                reuse.append(path)
+            else:
+                response = jsonify(entry.to_dict())
+                files[path] = (response.get_data(), response.content_type)
+    return files, pages, reuse
+
+def _export_path(request, session):
+    """The exported file that answers a read, or None to run the route"""
+    version = static_export.current()
+    if version is None or request.method != 'GET' or '_flashes' in session:
+        return None
+    if request.endpoint == 'index' and set(request.args) <= {'cursor'}:
+        return version.pages.get(request.args.get('cursor', ''))
+    if request.endpoint == 'map' and not request.args:
+        return 'map.html'
+    if request.endpoint == 'api_markers':
+        try:
+            zoom = _viewport_args(request.args)[4]
+        except ValueError:
+            return None
+        # Each file is the whole clustered layer for its zoom, so one file answers every viewport;
+        # individual markers above CLUSTER_MAX_ZOOM come from the live route for the viewport only
+        return f'markers/{zoom}.json' if zoom <= CLUSTER_MAX_ZOOM else None
+    return None
+
 def register_routes(app):
+    # Started by the first request rather than here, so a pre-fork master runs no threads
+    app.before_request(start_services)
+
+    if metrics.ENABLED:
+        @app.before_request
+        def start_request_trace():
+            _start_request_trace(g)
+
+        @app.after_request
+        def record_request(response):
+            return _record_request(request, g, response)
+
+    if SERVE_STATIC_EXPORT:
+        export_rebuilder.render = lambda changed_ids: export_files(app, changed_ids)
+
+        @app.before_request
+        def serve_static_export():
+            """Answer reads from the static export and refuse writes while it is being served"""
+            if request.endpoint in READ_ONLY_ENDPOINTS:
+                return 'The diary is read-only while it is served from a static export', 503
+            path = _export_path(request, session)
+            if path:
+                return static_export.send(request, path)
+
+        @app.route('/export/<path:path>')
+        def export_file(path):
+            """Any exported file, e.g. /export/entries/<id>.json"""
+            return static_export.send(request, path) or ('Not found', 404)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus scrape endpoint"""
+        return _metrics_response()
+
     @app.route('/')
     def index():
-        """Main page with form and entries"""
-        entries = notion_service.get_entries()
-        return render_template('python_frontend.html', entries=entries)
+        """Main page with form and one page of entries"""
+        generation = _cache_generation()
+        cached = _cached(request, generation)
+        if cached:
+            return cached
+
+        try:
+            entries, next_cursor = notion_service.query_entries(**_entry_query_args(request.args))
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('index'))
+        next_page = _next_page_args(request.args, next_cursor)
+        next_url = url_for('index', **next_page) if next_page else None
+
+        # Pop flashes before streaming starts so the session update isn't lost
+        get_flashed_messages(with_categories=True)
+        chunks = stream_template('python_frontend.html', entries=entries, next_url=next_url)
+        if generation is not None:
+            # Cached once fully sent; later hits are served whole with an ETag
+            chunks = response_cache.capture(request.full_path, generation, chunks, 'text/html; charset=utf-8')
+        return chunks
 
     @app.route('/map')
     def map():
-        """Map page"""    
-        api_key = os.getenv("GOOGLE_MAPS_API")
-        if not api_key:
+        """Map page"""
+        generation = _cache_generation()
+        cached = _cached(request, generation)
+        if cached:
+            return cached
+
+        context = _map_context()
+        if context is None:
             flash('Google Maps API key not configured', 'error')
             return redirect(url_for('index'))
+        body = render_template('map.html', **context)
+        return _cache_body(request, generation, body.encode(), 'text/html; charset=utf-8')
+
+    @app.route('/api/markers')
+    def api_markers():
+        """Markers in a viewport, clustered at low zoom levels"""
+        try:
+            viewport = _viewport_args(request.args)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        generation = _cache_generation()
+        cached = _cached(request, generation)
+        if cached:
+            return cached
+
+        marker_index.ensure_fresh(notion_service.data_version(), notion_service.iter_entries)
+        response = jsonify(_markers_payload(*viewport))
+        return _cache_body(request, generation, response.get_data(), response.content_type)
 
-        # Get entries with coordinates
-        entries = notion_service.get_entries()
-        markers = []
-        for entry in entries:
-            if entry.get('latitude') and entry.get('longitude'):
-                markers.append({
-                    'lat': entry['latitude'],
-                    'lng': entry['longitude'],
-                    'title': entry.get('tabelog_data', {}).get('name', 'Restaurant'),
-                    'url': entry.get('url', ''),  # Tabelog URL
-                    'notion_url': entry.get('notion_url', '')
-                }) 
-        # print("markers: ", markers)
-        return render_template('map.html', 
-                             api_key=api_key,
-                             markers=markers,
-                             center_lat=34.92534863829663,
-                             center_lng=135.79543051024322
-                            )
-   
     @app.route('/add_entry', methods=['POST'])
     def add_entry():
         """Handle form submission"""
-        link_url = request.form.get('link_url', '').strip()
-        notes = request.form.get('notes', '').strip()
-        
-        # Validation
-        if not link_url or not notes:
-            flash('Please fill in both link and notes!', 'error')
+        try:
+            payload = _submission(request.form)
+        except ValueError as e:
+            flash(str(e), 'error')
             return redirect(url_for('index'))
-        
-        if not notion_service.validate_url(link_url):
-            flash('Please enter a valid Tabelog URL!', 'error')
-            return redirect(url_for('index'))
-    
-        # Get coordinates from AI
-        ai_response = aiconfigs.get_ai_response(link_url)
-        parsed_coordinates = aiconfigs.parse_coordinates(ai_response["response"])
-        latitude = float(parsed_coordinates["latitude"]) if parsed_coordinates else None
-        longitude = float(parsed_coordinates["longitude"]) if parsed_coordinates else None
-        
-        # Get AI model and provider info
-        model_info = {
-            "model": ai_response.get("model", "Unknown"),
-            "provider": ai_response.get("provider", "Unknown")
-        }
-        
-        # Save to Notion with Tabelog data and AI info
-        success, message = notion_service.create_entry(link_url, notes, latitude, longitude, ai_model_info=model_info)
-        
-        if success:
-            flash(message, 'success')
-        else:
-            flash(message, 'error')
+
+        # Geocoding, scraping and the Notion write happen on a background worker
+        job_id = ingest_pool.submit(payload)
+        response = _submitted(job_id, url_for('job_status', job_id=job_id), request.accept_mimetypes)
+        if response:
+            return response
+        flash(_received_message(job_id), 'success')
         return redirect(url_for('index'))
 
+    @app.route('/api/jobs/<job_id>')
+    def job_status(job_id):
+        """Status of a queued entry submission"""
+        return _job_status(ingest_pool.queue, job_id)
+
     @app.route('/delete_entry/<entry_id>')
     def delete_entry(entry_id):
         """Delete an entry"""
         success, message = notion_service.delete_entry(entry_id)
-        
-        if success:
-            flash(message, 'success')
-        else:
-            flash(message, 'error')
-        
+        flash(message, 'success' if success else 'error')
         return redirect(url_for('index'))
 
+    @app.route('/api/entries')
+    def api_entries():
+        """Paginated, filtered and sorted entries as JSON"""
+        try:
+            return _entries_payload(*notion_service.query_entries(**_entry_query_args(request.args)))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+    @app.route('/api/bulk_import', methods=['POST'])
+    def bulk_import():
+        """Start a background import of an uploaded CSV/JSONL file of Tabelog links"""
+        upload = request.files.get('file')
+        try:
+            import_id, path = _bulk_import_upload(upload)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        upload.save(path)
+        _start_bulk_import(import_id, path)
+        return {"import_id": import_id, "status_url": url_for('bulk_import_status', import_id=import_id)}, 202
+
+    @app.route('/api/bulk_import/<import_id>')
+    def bulk_import_status(import_id):
+        """Progress of a bulk import"""
+        return _bulk_import_status(import_id)
+
+    @app.route('/api/bulk_import/<import_id>/resume', methods=['POST'])
+    def resume_bulk_import(import_id):
+        """Re-run an import, skipping rows its checkpoint already marks done"""
+        return _resume_bulk_import(import_id)
+
+    @app.route('/api/notion/webhook', methods=['POST'])
+    def notion_webhook():
+        """Receive Notion webhook events for pages in the diary database"""
+        event = request.get_json(silent=True) or {}
+        response = _webhook_check(event, request.get_data(), request.headers.get('X-Notion-Signature'))
+        if response:
+            return response
+        try:
+            notion_service.apply_webhook_event(event)
+        except Exception as e:
+            return _webhook_failed(e)
+        return {}, 200
+
+    @app.route('/api/debug/geocode_cache')
+    def debug_geocode_cache():
+        """Debug endpoint to see how many LLM geocoding calls the cache saved"""
+        return geocode_cache.stats()
+
+    @app.route('/api/debug/models')
+    def debug_models():
+        """Debug endpoint to see the rolling latency and error stats the model router hedges on"""
+        return aiconfigs.router.summary()
+
     @app.route('/api/debug/database')
     def debug_database():
         """Debug endpoint to see database properties"""
-        result, error = notion_service.get_database_info()
-        if error:
-            return jsonify({"error": error}), 400 if "not configured" in error else 500
-        return jsonify(result)
+        return _database_info_response(*notion_service.get_database_info())
     return app
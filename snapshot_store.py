@@ -0,0 +1,118 @@
+import hashlib
+import threading
+import time
+import zlib
+from db import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    body BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (url, fetched_at)
+);
+CREATE INDEX IF NOT EXISTS snapshots_digest ON snapshots (digest);
+"""
+
+class SnapshotStore:
+    """zlib-compressed Tabelog pages keyed by SHA-256, so identical fetches share one blob"""
+
+    def __init__(self, path, keep=5):
+        self.path = path
+        self.keep = keep  # snapshots kept per URL
+        self.conn = connect(path)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+
+    def put(self, url, html):
+        """Record a fetched page, storing its body only if no snapshot has the same content; returns the digest"""
+        raw = html.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                if self.conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone() is None:
+                    self.conn.execute("INSERT INTO blobs (digest, body) VALUES (?, ?)", (digest, zlib.compress(raw)))
+                self._record(url, digest)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return digest
+
+    def touch(self, url):
+        """Record that the latest snapshot was revalidated unchanged (a 304)"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT digest FROM snapshots WHERE url = ? ORDER BY fetched_at DESC LIMIT 1", (url,)
+            ).fetchone()
+            if row is None:
+                return
+            self.conn.execute("BEGIN")
+            try:
+                self._record(url, row["digest"])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _record(self, url, digest):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO snapshots (url, fetched_at, digest) VALUES (?, ?, ?)",
+            (url, time.time(), digest)
+        )
+        old = self.conn.execute(
+            "SELECT fetched_at, digest FROM snapshots WHERE url = ? ORDER BY fetched_at DESC LIMIT -1 OFFSET ?",
+            (url, self.keep)
+        ).fetchall()
+        for row in old:
+            self.conn.execute("DELETE FROM snapshots WHERE url = ? AND fetched_at = ?", (url, row["fetched_at"]))
+        # Drop bodies no other snapshot still points at
+        for digest in {row["digest"] for row in old}:
+            self.conn.execute(
+                "DELETE FROM blobs WHERE digest = ? AND NOT EXISTS (SELECT 1 FROM snapshots WHERE digest = ?)",
+                (digest, digest)
+            )
+
+    def latest(self, url):
+        """The most recent page body for a URL, or None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body FROM snapshots JOIN blobs USING (digest) WHERE url = ? "
+                "ORDER BY fetched_at DESC LIMIT 1", (url,)
+            ).fetchone()
+        return zlib.decompress(row["body"]).decode("utf-8") if row else None
+
+    def body(self, digest):
+        """The page body stored under a digest, or None once no snapshot points at it"""
+        with self.lock:
+            row = self.conn.execute("SELECT body FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        return zlib.decompress(row["body"]).decode("utf-8") if row else None
+
+    def fetched_at(self):
+        """{url: time of its latest fetch or revalidation}"""
+        with self.lock:
+            rows = self.conn.execute("SELECT url, MAX(fetched_at) AS fetched_at FROM snapshots GROUP BY url").fetchall()
+        return {row["url"]: row["fetched_at"] for row in rows}
+
+    def iter_latest(self):
+        """Yield (url, compressed body) for each URL's latest snapshot; decompress with zlib"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT url, body FROM snapshots s JOIN blobs USING (digest) "
+                "WHERE fetched_at = (SELECT MAX(fetched_at) FROM snapshots WHERE url = s.url)"
+            ).fetchall()
+        for row in rows:
+            yield row["url"], row["body"]
+
+    def stats(self):
+        """Snapshot and blob counts and compressed size"""
+        with self.lock:
+            snapshots = self.conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+            blobs, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM blobs").fetchone()
+        return {"snapshots": snapshots, "blobs": blobs, "bytes": size}
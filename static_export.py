@@ -0,0 +1,280 @@
+"""Versioned, precompressed static copy of the diary's read routes.
+
+    python static_export.py [--dir export]
+
+Each build is a directory export/vNNNNNN/ of files with .gz (and .br, if the
+brotli package is installed) siblings and a manifest.json; export/current links
+to the newest. Files unchanged since the previous build are hard-linked rather
+than rewritten. With SERVE_STATIC_EXPORT=true the app answers reads from the
+current build and rebuilds it in the background when entries change.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from flask import send_file
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST = "manifest.json"
+
+def _compressed(body):
+    """{encoding: body} for each precompressed variant smaller than the original"""
+    variants = {"gzip": gzip.compress(body, 9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(body)}
+
+SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+class ExportVersion:
+    """One finished build: its directory and manifest"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.files = manifest["files"]  # relative path -> {"etag", "mimetype", "encodings"}
+        self.pages = manifest["pages"]  # index cursor ("" for the first page) -> relative path
+        self.built_at = manifest["built_at"]
+
+class StaticExport:
+    """Builds export versions and serves files from the current one"""
+
+    def __init__(self, root, keep=3):
+        # Absolute, since send_file resolves relative paths against the app's root_path, not the cwd
+        self.root = os.path.abspath(root)
+        self.keep = keep  # finished versions kept on disk, including the current one
+        self.link = os.path.join(self.root, "current")
+        self._current = None
+        self.lock = threading.Lock()
+
+    def current(self):
+        """The version export/current points at, or None before the first build"""
+        try:
+            name = os.readlink(self.link)
+        except OSError:
+            return None
+        current = self._current
+        if current is None or current.name != name:
+            current = self._current = ExportVersion(os.path.join(self.root, name))
+        return current
+
+    def build(self, files, pages, reuse=()):
+        """Write a new version and point export/current at it.
+
+        files maps relative paths to (body bytes, mimetype); paths in reuse are carried over
+        from the current version unchanged. Returns {"version", "written", "linked"}.
+        """
+        with self.lock, metrics.span("export.build"):
+            os.makedirs(self.root, exist_ok=True)
+            previous = self.current()
+            staging = os.path.join(self.root, f".build-{uuid.uuid4().hex}")
+            os.makedirs(staging)
+            manifest = {"built_at": time.time(), "pages": pages, "files": {}}
+            written = linked = 0
+            try:
+                for path in reuse:
+                    if previous is None or path not in previous.files:
+                        raise KeyError(f"{path} is not in the current export to reuse")
+                    self._link(previous, staging, path)
+                    manifest["files"][path] = previous.files[path]
+                    linked += 1
+                for path, (body, mimetype) in files.items():
+                    etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+                    old = previous.files.get(path) if previous is not None else None
+                    if old is not None and old["etag"] == etag:
+                        self._link(previous, staging, path)
+                        manifest["files"][path] = old
+                        linked += 1
+                        continue
+                    encodings = self._write(staging, path, body)
+                    manifest["files"][path] = {"etag": etag, "mimetype": mimetype, "encodings": encodings}
+                    written += 1
+                if (previous is not None and not written and manifest["files"] == previous.files
+                        and pages == previous.pages):
+                    # Nothing changed; keep serving the current version
+                    shutil.rmtree(staging)
+                    return {"version": previous.name, "written": 0, "linked": linked}
+                with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as f:
+                    json.dump(manifest, f)
+                name = self._publish(staging)
+            except Exception:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+            self._prune()
+            return {"version": name, "written": written, "linked": linked}
+
+    def _write(self, staging, path, body):
+        target = os.path.join(staging, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(body)
+        variants = _compressed(body)
+        for encoding, data in variants.items():
+            with open(target + SUFFIXES[encoding], "wb") as f:
+                f.write(data)
+        return sorted(variants)
+
+    def _link(self, previous, staging, path):
+        target = os.path.join(staging, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        for suffix in [""] + [SUFFIXES[encoding] for encoding in previous.files[path]["encodings"]]:
+            source = os.path.join(previous.path, path) + suffix
+            try:
+                os.link(source, target + suffix)
+            except OSError:
+                # Hard links need the same filesystem
+                shutil.copy2(source, target + suffix)
+
+    def _versions(self):
+        return sorted(name for name in os.listdir(self.root) if name.startswith("v") and name[1:].isdigit())
+
+    def _publish(self, staging):
+        """Rename the staging directory to the next version and swap the current link to it"""
+        while True:
+            versions = self._versions()
+            name = f"v{int(versions[-1][1:]) + 1 if versions else 1:06d}"
+            try:
+                os.rename(staging, os.path.join(self.root, name))
+                break
+            except OSError:
+                # Another worker process published the same number first
+                if not os.path.exists(os.path.join(self.root, name)):
+                    raise
+        link = os.path.join(self.root, f".current-{uuid.uuid4().hex}")
+        os.symlink(name, link)
+        os.replace(link, self.link)
+        return name
+
+    def _prune(self):
+        current = os.path.basename(os.readlink(self.link))
+        for name in self._versions()[:-self.keep]:
+            if name != current:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def _lookup(self, request, path):
+        """(file to send, manifest record, encoding) for an exported file, or None if it isn't exported"""
+        version = self.current()
+        record = version.files.get(path) if version is not None else None
+        if record is None:
+            return None
+        encoding = request.accept_encodings.best_match(
+            [encoding for encoding in ("br", "gzip") if encoding in record["encodings"]]
+        )
+        return os.path.join(version.path, path) + SUFFIXES.get(encoding, ""), record, encoding
+
+    def _finish(self, response, encoding):
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "no-cache"
+        metrics.cache_lookups.inc("export", "hit")
+        return response
+
+    def send(self, request, path):
+        """A response for an exported file in the best encoding the client accepts, or None if it isn't exported"""
+        found = self._lookup(request, path)
+        if found is None:
+            return None
+        filename, record, encoding = found
+        response = send_file(
+            filename,
+            mimetype=record["mimetype"],
+            etag=f"{record['etag']}{SUFFIXES.get(encoding, '')}",
+            conditional=True
+        )
+        return self._finish(response, encoding)
+
+    async def send_async(self, request, path):
+        """send for the Quart app"""
+        from quart import send_file as quart_send_file
+        found = self._lookup(request, path)
+        if found is None:
+            return None
+        filename, record, encoding = found
+        response = await quart_send_file(filename, mimetype=record["mimetype"], add_etags=False)
+        response.set_etag(f"{record['etag']}{SUFFIXES.get(encoding, '')}")
+        return self._finish(await response.make_conditional(request), encoding)
+
+class ExportRebuilder:
+    """Background thread that rebuilds the export a short delay after entries change.
+
+    render(changed_ids) returns (files, pages, reuse) for StaticExport.build; changed_ids is
+    None for a full render.
+    """
+
+    def __init__(self, export, render, delay=2.0):
+        self.export = export
+        self.render = render
+        self.delay = delay  # seconds to gather a burst of changes into one build
+        self._changed = None  # entry IDs changed since the last build; None means rebuild everything
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def changed(self, changes, version=None):
+        """Change-feed subscriber; marks the changed entries for the next build"""
+        with self._lock:
+            if self._changed is not None:
+                self._changed.update(change.entry_id for change in changes)
+        self._wake.set()
+
+    def start(self):
+        """Start the thread once; its first pass re-renders everything to catch up with the store"""
+        if self._thread is not None:
+            return
+        if self.render is None:
+            raise RuntimeError("The static export has no render function; register the app's routes first")
+        self._wake.set()
+        self._thread = threading.Thread(target=self._run, name="static-export", daemon=True)
+        self._thread.start()
+
+    def rebuild(self):
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        if self.export.current() is None:
+            changed = None
+        try:
+            return self.export.build(*self.render(changed))
+        except Exception:
+            with self._lock:
+                self._changed = None
+            if changed is not None:
+                # e.g. a reused file missing from the current version; rebuild in full right away
+                self._wake.set()
+            raise
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.delay)
+            self._wake.clear()
+            try:
+                print(f"Static export: {self.rebuild()}")
+            except Exception as e:
+                print(f"Error rebuilding the static export: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the diary's pages, markers and entries as precompressed static files")
+    parser.add_argument("--dir", default=os.getenv("STATIC_EXPORT_DIR", "export"), help="export root (default: export)")
+    parser.add_argument("--keep", type=int, default=3, help="versions to keep")
+    args = parser.parse_args()
+
+    from app import app
+    import routes
+    export = StaticExport(args.dir, keep=args.keep)
+    print(export.build(*routes.export_files(app)))
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,301 @@
+import asyncio
+import os
+import threading
+import time
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from db import connect
+from snapshot_store import SnapshotStore
+import metrics
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+    _LXML_PARSER = lxml_html.HTMLParser(encoding="utf-8")
+except ImportError:
+    lxml_html = None
+
+HEADERS = {"User-Agent": "Mozilla/5.0", "Accept-Encoding": "gzip, deflate"}
+
+# (connect, read) seconds, so a stalled Tabelog response can't hold a worker forever
+TIMEOUT = (
+    float(os.getenv("TABELOG_CONNECT_TIMEOUT", "3.05")),
+    float(os.getenv("TABELOG_READ_TIMEOUT", "10"))
+)
+
+# "lxml" for the fast path, anything else (or lxml missing) uses BeautifulSoup
+PARSER_ENGINE = os.getenv("TABELOG_PARSER", "lxml")
+
+# Cached pages younger than this are served without asking Tabelog at all
+CACHE_MAX_AGE = float(os.getenv("TABELOG_CACHE_MAX_AGE", "3600"))
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    digest TEXT,
+    body TEXT,
+    fetched_at REAL NOT NULL
+);
+"""
+
+def _build_session():
+    """Create the pooled session shared by every scrape"""
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class ResponseCache:
+    """SQLite cache of fetched pages with the validators needed to revalidate them.
+
+    With a snapshot store, page bodies are archived there and a row keeps only their digest.
+    """
+
+    def __init__(self, path, snapshots=None):
+        self.path = path
+        self.snapshots = snapshots
+        self.conn = connect(path)
+        self.lock = threading.Lock()
+        with self.lock:
+            existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(responses)")}
+            if existing and "digest" not in existing:
+                # Rows from before snapshots hold a second, uncompressed copy of each page; refetch instead
+                self.conn.execute("DROP TABLE responses")
+            self.conn.executescript(CACHE_SCHEMA)
+
+    def get(self, url):
+        """Return the cached row for a URL with its body, or None"""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        cached = dict(row)
+        if cached["digest"] is not None:
+            cached["body"] = self.snapshots.body(cached["digest"]) if self.snapshots else None
+            if cached["body"] is None:
+                # The snapshot was pruned or archived elsewhere, so the validators are no use either
+                return None
+        return cached
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """Store a page body along with its ETag/Last-Modified validators"""
+        digest = self.snapshots.put(url, body) if self.snapshots else None
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, digest, body, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, digest, None if digest else body, time.time())
+            )
+
+    def touch(self, url):
+        """Mark a cached page as freshly revalidated"""
+        with self.lock:
+            self.conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+session = _build_session()
+
+# Every fetched page is archived here for re-extraction; an empty TABELOG_SNAPSHOT_PATH turns it off
+_snapshot_path = os.getenv("TABELOG_SNAPSHOT_PATH", "tabelog_snapshots.db")
+snapshots = SnapshotStore(_snapshot_path, keep=int(os.getenv("TABELOG_SNAPSHOT_KEEP", "5"))) if _snapshot_path else None
+
+# An empty TABELOG_CACHE_PATH turns off the response cache
+_cache_path = os.getenv("TABELOG_CACHE_PATH", "tabelog_cache.db")
+response_cache = ResponseCache(_cache_path, snapshots) if _cache_path else None
+
+def _cached_page(url, max_age=CACHE_MAX_AGE):
+    """Return (fresh body or None, cached row, revalidation headers) for a URL"""
+    cached = response_cache.get(url) if response_cache else None
+    if cached and time.time() - cached["fetched_at"] < max_age:
+        metrics.cache_lookups.inc("tabelog", "hit")
+        return cached["body"], cached, {}
+
+    headers = {}
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+    return None, cached, headers
+
+def _store_page(url, text, response_headers):
+    if not response_cache:
+        if snapshots:
+            snapshots.put(url, text)
+        return text
+    metrics.cache_lookups.inc("tabelog", "miss")
+    response_cache.put(
+        url, text,
+        etag=response_headers.get("ETag"),
+        last_modified=response_headers.get("Last-Modified")
+    )
+    return text
+
+def _revalidated(url):
+    metrics.cache_lookups.inc("tabelog", "revalidated")
+    response_cache.touch(url)
+    if snapshots:
+        snapshots.touch(url)
+
+def fetch_page(url, max_age=CACHE_MAX_AGE):
+    """Fetch a Tabelog page through the shared session, revalidating cached copies older than max_age"""
+    body, cached, headers = _cached_page(url, max_age)
+    if body is not None:
+        return body
+
+    with metrics.span("tabelog.fetch"):
+        page = session.get(url, headers=headers, timeout=TIMEOUT)
+    if page.status_code == 304 and cached:
+        _revalidated(url)
+        return cached["body"]
+    page.raise_for_status()
+    return _store_page(url, page.text, page.headers)
+
+# Lazily created httpx client for the async serving mode
+_async_client = None
+
+def get_async_client():
+    """Return the pooled httpx.AsyncClient shared by async scrapes"""
+    global _async_client
+    if _async_client is None:
+        import httpx
+        _async_client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=httpx.Timeout(TIMEOUT[1], connect=TIMEOUT[0]),
+            limits=httpx.Limits(max_connections=16, max_keepalive_connections=16),
+            transport=httpx.AsyncHTTPTransport(retries=1)
+        )
+    return _async_client
+
+async def fetch_page_async(url, max_age=CACHE_MAX_AGE):
+    """fetch_page over httpx, retrying 429/5xx like the sync session's Retry policy"""
+    body, cached, headers = _cached_page(url, max_age)
+    if body is not None:
+        return body
+
+    client = get_async_client()
+    with metrics.span("tabelog.fetch"):
+        for attempt in range(4):
+            page = await client.get(url, headers=headers)
+            if page.status_code not in (429, 500, 502, 503, 504) or attempt == 3:
+                break
+            retry_after = page.headers.get("Retry-After", "")
+            await asyncio.sleep(float(retry_after) if retry_after.isdigit() else 0.5 * 2 ** attempt)
+
+    if page.status_code == 304 and cached:
+        _revalidated(url)
+        return cached["body"]
+    page.raise_for_status()
+    return _store_page(url, page.text, page.headers)
+
+def _has_class(tag, class_name):
+    """XPath for a tag whose class attribute contains class_name as a whole word"""
+    return f"//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+if lxml_html is not None:
+    # Compiled once; each selector mirrors a BeautifulSoup lookup in _parse_with_soup
+    _XPATHS = {
+        name: etree.XPath(expr)
+        for name, expr in {
+            "name": _has_class("h2", "rstinfo-table__name-wrap"),
+            "name_fallback": _has_class("h2", "display-name"),
+            "rating": _has_class("b", "c-rating__val"),
+            "categories": _has_class("span", "linktree__parent-target-text"),
+            "categories_fallback": _has_class("span", "category"),
+            "address": _has_class("p", "rstinfo-table__address"),
+        }.items()
+    }
+    # Same text BeautifulSoup's get_text(strip=True) returns: no script/style or comments
+    _TEXT = etree.XPath("descendant::text()[not(ancestor::script) and not(ancestor::style)]")
+
+def _lxml_text(element):
+    return "".join(part.strip() for part in _TEXT(element))
+
+def _parse_with_lxml(html):
+    """Extract restaurant fields with lxml and precompiled XPath selectors"""
+    tree = lxml_html.document_fromstring(html.encode("utf-8"), parser=_LXML_PARSER)
+
+    name_tags = _XPATHS["name"](tree) or _XPATHS["name_fallback"](tree)
+    name = _lxml_text(name_tags[0]) if name_tags else None
+
+    rating_tags = _XPATHS["rating"](tree)
+    rating = float(_lxml_text(rating_tags[0])) if rating_tags else None
+
+    category_tags = _XPATHS["categories"](tree) or _XPATHS["categories_fallback"](tree)
+    categories = [text for text in (_lxml_text(tag) for tag in category_tags) if text]
+
+    address_tags = _XPATHS["address"](tree)
+    address = _lxml_text(address_tags[0]) if address_tags else None
+
+    return {
+        "name": name,
+        "rating": rating,
+        "categories": categories,
+        "address": address
+    }
+
+def _parse_with_soup(html):
+    """Extract restaurant fields with BeautifulSoup's pure-Python parser"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+
+    name_tag = soup.find("h2", class_="rstinfo-table__name-wrap")
+    if not name_tag:
+        name_tag = soup.find("h2", class_="display-name")
+    name = name_tag.get_text(strip=True) if name_tag else None
+
+    rating_tag = soup.find("b", class_="c-rating__val")
+    rating = float(rating_tag.get_text(strip=True)) if rating_tag else None
+
+    categories = []
+    category_tags = soup.find_all("span", class_="linktree__parent-target-text")
+    if not category_tags:
+        category_tags = soup.find_all("span", class_="category")
+    for tag in category_tags:
+        cat_text = tag.get_text(strip=True)
+        if cat_text:
+            categories.append(cat_text)
+
+    address_tag = soup.find("p", class_="rstinfo-table__address")
+    address = address_tag.get_text(strip=True) if address_tag else None
+
+    return {
+        "name": name,
+        "rating": rating,
+        "categories": categories,
+        "address": address
+    }
+
+def parse_tabelog(html, engine=None):
+    """Extract name, rating, categories and address from a Tabelog page"""
+    engine = engine or PARSER_ENGINE
+    with metrics.span("tabelog.parse"):
+        if engine == "lxml" and lxml_html is not None:
+            return _parse_with_lxml(html)
+        return _parse_with_soup(html)
 
 def scrape_tabelog(url):
     """Scrape Tabelog restaurant data"""
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        page = requests.get(url, headers=headers)
-        page.raise_for_status()
-        soup = BeautifulSoup(page.text, "html.parser")
-
-        name_tag = soup.find("h2", class_="rstinfo-table__name-wrap")
-        if not name_tag:
-            name_tag = soup.find("h2", class_="display-name")
-        name = name_tag.get_text(strip=True) if name_tag else None
-
-        rating_tag = soup.find("b", class_="c-rating__val")
-        rating = float(rating_tag.get_text(strip=True)) if rating_tag else None
-
-        categories = []
-        category_tags = soup.find_all("span", class_="linktree__parent-target-text")
-        if not category_tags:
-            category_tags = soup.find_all("span", class_="category")
-        for tag in category_tags:
-            cat_text = tag.get_text(strip=True)
-            if cat_text:
-                categories.append(cat_text)
-
-        address_tag = soup.find("p", class_="rstinfo-table__address")
-        address = address_tag.get_text(strip=True) if address_tag else None
-
-        return {
-            "name": name,
-            "rating": rating,
-            "categories": categories,
-            "address": address
-        }
+        return parse_tabelog(fetch_page(url))
+    except Exception as e:
+        print(f"Error scraping Tabelog: {e}")
+        return None
+
+async def scrape_tabelog_async(url):
+    """scrape_tabelog for the async serving mode; parsing runs in a worker thread off the event loop"""
+    try:
+        return await asyncio.to_thread(parse_tabelog, await fetch_page_async(url))
     except Exception as e:
         print(f"Error scraping Tabelog: {e}")
-        return None 
\ No newline at end of file
+        return None